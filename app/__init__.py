@@ -121,6 +121,17 @@ def create_app():
             else:
                 exec_sql(sql_pg)
 
+        def add_index(sql_sqlite, sql_pg):
+            # Index idempotents (CREATE INDEX IF NOT EXISTS), un échec n'empêche pas le boot
+            try:
+                if dialect == "sqlite":
+                    exec_sql(sql_sqlite)
+                else:
+                    exec_sql(sql_pg)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+
         # --------------------------------------------------------------
         # 0) LEGACY : colonne user.role (OBLIGATOIRE pour le boot)
         # --------------------------------------------------------------
@@ -163,6 +174,94 @@ def create_app():
         except Exception:
             db.session.rollback()
 
+        # --------------------------------------------------------------
+        # 3) Recherche participants (ILIKE '%x%') : index trigram Postgres
+        # --------------------------------------------------------------
+        if dialect == "postgresql":
+            try:
+                exec_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                exec_sql(
+                    "CREATE INDEX IF NOT EXISTS participant_nom_trgm "
+                    "ON participant USING GIN (nom gin_trgm_ops)"
+                )
+                exec_sql(
+                    "CREATE INDEX IF NOT EXISTS participant_prenom_trgm "
+                    "ON participant USING GIN (prenom gin_trgm_ops)"
+                )
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+
+        # --------------------------------------------------------------
+        # 4) Sessions : date effective en colonne générée (indexable)
+        #    SQLite ne sait ajouter qu'une colonne générée VIRTUAL.
+        # --------------------------------------------------------------
+        try:
+            add_col(
+                "session_activite",
+                "session_effective_date",
+                "ALTER TABLE session_activite ADD COLUMN session_effective_date DATE "
+                "GENERATED ALWAYS AS (COALESCE(rdv_date, date_session)) VIRTUAL",
+                "ALTER TABLE session_activite ADD COLUMN IF NOT EXISTS session_effective_date DATE "
+                "GENERATED ALWAYS AS (COALESCE(rdv_date, date_session)) STORED",
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+        add_index(
+            "CREATE INDEX IF NOT EXISTS ix_session_activite_session_effective_date "
+            "ON session_activite (session_effective_date)",
+            "CREATE INDEX IF NOT EXISTS ix_session_activite_session_effective_date "
+            "ON session_activite (session_effective_date)",
+        )
+
+        # --------------------------------------------------------------
+        # 5) Stats & Impacts : index composites pour les jointures
+        #    présence -> session -> atelier (filtres date / atelier / type)
+        #    NB: (session_id, participant_id) est déjà couvert par
+        #    uq_presence_session_participant.
+        # --------------------------------------------------------------
+        #    Postgres : signature_path incluse (suppression d'un participant
+        #    en index-only scan).
+        add_index(
+            "CREATE INDEX IF NOT EXISTS presence_participant_session "
+            "ON presence_activite (participant_id, session_id)",
+            "CREATE INDEX IF NOT EXISTS presence_participant_session_sig "
+            "ON presence_activite (participant_id, session_id) INCLUDE (signature_path)",
+        )
+        add_index(
+            "CREATE INDEX IF NOT EXISTS session_atelier_eff_date "
+            "ON session_activite (atelier_id, session_effective_date)",
+            "CREATE INDEX IF NOT EXISTS session_atelier_eff_date "
+            "ON session_activite (atelier_id, session_effective_date)",
+        )
+        add_index(
+            "CREATE INDEX IF NOT EXISTS session_type_deleted "
+            "ON session_activite (session_type, is_deleted) WHERE is_deleted = 0",
+            "CREATE INDEX IF NOT EXISTS session_type_deleted "
+            "ON session_activite (session_type, is_deleted) WHERE is_deleted = false",
+        )
+        # Liste des secteurs des filtres (DISTINCT secteur des ateliers actifs)
+        add_index(
+            "CREATE INDEX IF NOT EXISTS atelier_secteur_actif "
+            "ON atelier_activite (secteur) WHERE is_deleted = 0",
+            "CREATE INDEX IF NOT EXISTS atelier_secteur_actif "
+            "ON atelier_activite (secteur) WHERE is_deleted = false",
+        )
+
+        # --------------------------------------------------------------
+        # 6) Stats & Impacts : vue matérialisée d'occupation (Postgres)
+        # --------------------------------------------------------------
+        if dialect == "postgresql":
+            from app.statsimpact.occupancy import OCCUPANCY_VIEW_DDL
+
+            try:
+                for sql in OCCUPANCY_VIEW_DDL:
+                    exec_sql(sql)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+
     # ------------------------------------------------------------------
     # INIT DB (ORDRE CRUCIAL)
     # ------------------------------------------------------------------
@@ -180,6 +279,10 @@ def create_app():
         from app.secteurs import bootstrap_secteurs_from_config
         bootstrap_secteurs_from_config()
 
+        # 5) Vue d'occupation (Postgres) : rafraîchie en tâche de fond, jamais pendant une requête
+        from app.statsimpact.occupancy import start_occupancy_refresher
+        start_occupancy_refresher(app)
+
         print("DB URI =", db.engine.url)
         print("DB DIALECT =", db.engine.dialect.name)
 
@@ -907,6 +907,13 @@ class SessionActivite(db.Model):
     rdv_fin = db.Column(db.String(10), nullable=True)
     duree_minutes = db.Column(db.Integer, nullable=True)
 
+    # Date effective (rdv_date sinon date_session), calculée et indexée par la base
+    session_effective_date = db.Column(
+        db.Date,
+        db.Computed("COALESCE(rdv_date, date_session)", persisted=True),
+        index=True,
+    )
+
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Soft-delete (safe during tests)
@@ -3,10 +3,13 @@ from __future__ import annotations
 from collections import Counter, defaultdict
 from dataclasses import dataclass
 from datetime import date, datetime, timedelta
+from functools import lru_cache
+from itertools import groupby
 from typing import Any, Dict, List, Optional, Set, Tuple
 
 from flask_login import current_user
-from sqlalchemy import func
+from sqlalchemy import func, or_
+from sqlalchemy.orm import selectinload
 
 from app.extensions import db
 from app.models import AtelierActivite, PresenceActivite, SessionActivite, PeriodeFinancement, Participant
@@ -23,10 +26,13 @@ def _parse_date(s: str) -> Optional[date]:
         return None
 
 
+@lru_cache(maxsize=1024)
 def _parse_time_minutes(t: Optional[str]) -> Optional[int]:
     """
     Accepts formats like: "14:30", "14h30", "14h", "14:30:00".
     Returns minutes since midnight.
+    Memoized: only a handful of distinct time strings exist ("14:00", "9h30"...),
+    each one is parsed once per process.
     """
     if not t:
         return None
@@ -137,7 +143,8 @@ def _apply_preset(preset: str, today: Optional[date] = None) -> Tuple[date, date
 
 
 def _session_date_expr():
-    return func.coalesce(SessionActivite.rdv_date, SessionActivite.date_session)
+    # Colonne générée COALESCE(rdv_date, date_session), indexée
+    return SessionActivite.session_effective_date
 
 
 def _session_duration_minutes(session: SessionActivite, atelier: AtelierActivite) -> int:
@@ -783,71 +790,94 @@ def compute_demography_stats(flt: StatsFilters) -> Dict[str, Any]:
     }
 
 
-def compute_participants_stats(flt: StatsFilters) -> Dict[str, Any]:
-    sessions_rows, presences = _get_scoped_sessions_and_presences(flt)
-    if not presences:
-        return {"participants": [], "total": 0}
-
-    session_map: Dict[int, Tuple[SessionActivite, AtelierActivite]] = {
-        s.id: (s, a) for s, a in sessions_rows
-    }
-    pids = sorted(set(p.participant_id for p in presences))
-    participants = {p.id: p for p in db.session.query(Participant).filter(Participant.id.in_(pids)).all()}
-
-    per_participant: Dict[int, Dict[str, Any]] = {}
+def participant_in_scope(flt: StatsFilters, participant_id: int) -> bool:
+    """
+    Le participant a-t-il au moins une présence dans le périmètre filtré ?
+    (même règle que la liste de compute_participants_stats, via un simple EXISTS)
+    """
+    q = (
+        db.session.query(PresenceActivite.id)
+        .join(SessionActivite, SessionActivite.id == PresenceActivite.session_id)
+        .join(AtelierActivite, AtelierActivite.id == SessionActivite.atelier_id)
+        .filter(PresenceActivite.participant_id == participant_id)
+    )
+    q = _apply_common_filters(q, flt)
+    return bool(db.session.query(q.exists()).scalar())
 
-    for p in presences:
-        pid = p.participant_id
-        participant = participants.get(pid)
-        sess_tuple = session_map.get(p.session_id)
-        if not participant or not sess_tuple:
-            continue
-        session, atelier = sess_tuple
-        date_visit = session.rdv_date or session.date_session
-        aid = atelier.id
 
-        if pid not in per_participant:
-            per_participant[pid] = {
-                "id": pid,
-                "nom": participant.nom,
-                "prenom": participant.prenom,
-                "age": participant.age,
-                "genre": participant.genre,
-                "date_naissance": participant.date_naissance,
-                "ville": participant.ville,
-                "quartier": participant.quartier.nom if participant.quartier else None,
-                "quartier_id": participant.quartier_id,
-                "qpv": participant.quartier.is_qpv if participant.quartier else False,
-                "telephone": participant.telephone,
-                "email": participant.email,
-                "type_public": getattr(participant, "type_public", None) or "H",
-                "sessions": [],
-                "ateliers": {},
-                "visites": 0,
-            }
+def compute_participants_stats(flt: StatsFilters) -> Dict[str, Any]:
+    # Tri fait par la base : participants (nom, prénom), puis visites de la plus
+    # récente à la plus ancienne (sans date en tête, ex aequo par session). On
+    # assemble ensuite en un seul passage via groupby ; seuls les ateliers d'un
+    # participant sont remis dans l'ordre des présences (première session suivie).
+    rows_q = (
+        db.session.query(Participant, SessionActivite, AtelierActivite)
+        .select_from(PresenceActivite)
+        .join(Participant, Participant.id == PresenceActivite.participant_id)
+        .join(SessionActivite, SessionActivite.id == PresenceActivite.session_id)
+        .join(AtelierActivite, AtelierActivite.id == SessionActivite.atelier_id)
+        # Quartier chargé par paquet (une requête IN par lot) plutôt qu'au fil des lignes
+        .options(selectinload(Participant.quartier))
+    )
+    rows_q = _apply_common_filters(rows_q, flt)
+    rows_q = rows_q.order_by(
+        Participant.nom.asc(),
+        Participant.prenom.asc(),
+        Participant.id.asc(),
+        _session_date_expr().desc().nulls_first(),
+        SessionActivite.id.asc(),
+    )
 
-        per_participant[pid]["visites"] += 1
-        per_participant[pid]["sessions"].append(
-            {
-                "date": date_visit,
-                "atelier": atelier.nom,
-                "atelier_id": aid,
-                "secteur": atelier.secteur,
-            }
-        )
-        a_map = per_participant[pid]["ateliers"].setdefault(
-            aid, {"atelier": atelier.nom, "secteur": atelier.secteur, "visites": 0, "dates": []}
-        )
-        a_map["visites"] += 1
-        if date_visit:
-            a_map["dates"].append(date_visit)
+    participants_list: List[Dict[str, Any]] = []
+    for pid, group in groupby(rows_q.yield_per(2000), key=lambda row: row[0].id):
+        obj: Optional[Dict[str, Any]] = None
+        first_session: Dict[int, int] = {}
+        for participant, session, atelier in group:
+            if obj is None:
+                obj = {
+                    "id": pid,
+                    "nom": participant.nom,
+                    "prenom": participant.prenom,
+                    "age": participant.age,
+                    "genre": participant.genre,
+                    "date_naissance": participant.date_naissance,
+                    "ville": participant.ville,
+                    "quartier": participant.quartier.nom if participant.quartier else None,
+                    "quartier_id": participant.quartier_id,
+                    "qpv": participant.quartier.is_qpv if participant.quartier else False,
+                    "telephone": participant.telephone,
+                    "email": participant.email,
+                    "type_public": getattr(participant, "type_public", None) or "H",
+                    "sessions": [],
+                    "ateliers": {},
+                    "visites": 0,
+                }
+
+            date_visit = session.rdv_date or session.date_session
+            aid = atelier.id
+
+            obj["visites"] += 1
+            obj["sessions"].append(
+                {
+                    "date": date_visit,
+                    "atelier": atelier.nom,
+                    "atelier_id": aid,
+                    "secteur": atelier.secteur,
+                }
+            )
+            a_map = obj["ateliers"].setdefault(
+                aid, {"atelier": atelier.nom, "secteur": atelier.secteur, "visites": 0, "dates": []}
+            )
+            a_map["visites"] += 1
+            if date_visit:
+                a_map["dates"].append(date_visit)
+            if session.id < first_session.get(aid, session.id + 1):
+                first_session[aid] = session.id
 
-    for obj in per_participant.values():
-        obj["sessions"].sort(key=lambda s: s["date"] or date.max, reverse=True)
-        for a in obj["ateliers"].values():
-            a["dates"].sort(reverse=True)
+        if len(obj["ateliers"]) > 1:
+            obj["ateliers"] = {aid: obj["ateliers"][aid] for aid in sorted(first_session, key=first_session.get)}
+        participants_list.append(obj)
 
-    participants_list = sorted(per_participant.values(), key=lambda x: (x["nom"] or "", x["prenom"] or ""))
     return {"participants": participants_list, "total": len(participants_list)}
 
 
@@ -856,6 +886,24 @@ def compute_participants_stats(flt: StatsFilters) -> Dict[str, Any]:
 # Le Magatomatique (présences -> stats "Excel-like" mais intelligentes)
 # ---------------------------
 
+def _count_unique_participants(fs, group_col) -> Dict[Any, int]:
+    """
+    Nb de participants uniques par valeur de group_col (secteur ou atelier),
+    sur les sessions de la CTE fs. Les paires (groupe, participant) sont
+    dédoublonnées dans une sous-requête puis comptées : {groupe: nb}.
+    """
+    pairs = (
+        db.session.query(group_col.label("grp"), PresenceActivite.participant_id.label("pid"))
+        .select_from(fs)
+        .join(AtelierActivite, fs.c.atelier_id == AtelierActivite.id)
+        .join(PresenceActivite, PresenceActivite.session_id == fs.c.id)
+        .distinct()
+        .subquery()
+    )
+    rows = db.session.query(pairs.c.grp, func.count()).group_by(pairs.c.grp).all()
+    return {grp: int(n or 0) for grp, n in rows}
+
+
 def compute_magatomatique(
     flt: StatsFilters,
     *,
@@ -880,27 +928,29 @@ def compute_magatomatique(
     if v not in ("macro", "participants", "matrix"):
         v = "macro"
 
-    # Base: sessions filtrées
-    base_q = (
-        db.session.query(SessionActivite, AtelierActivite)
-        .join(AtelierActivite, SessionActivite.atelier_id == AtelierActivite.id)
-    )
-    base_q = _apply_common_filters(base_q, flt)
+    # Base: sessions filtrées, construites une seule fois (CTE) puis jointes par
+    # chaque agrégat : un seul prédicat à planifier / évaluer côté base.
+    fs = _apply_common_filters(
+        db.session.query(
+            SessionActivite.id.label("id"),
+            SessionActivite.atelier_id.label("atelier_id"),
+            _session_date_expr().label("sdate"),
+        ).join(AtelierActivite, SessionActivite.atelier_id == AtelierActivite.id),
+        flt,
+    ).cte("filtered_sessions")
 
     # ===== Macro =====
     # Agrégats par secteur / atelier
     sector_rows = (
         db.session.query(
             AtelierActivite.secteur.label("secteur"),
-            func.count(func.distinct(SessionActivite.id)).label("nb_sessions"),
+            func.count(func.distinct(fs.c.id)).label("nb_sessions"),
             func.count(PresenceActivite.id).label("nb_presences"),
-            func.count(func.distinct(PresenceActivite.participant_id)).label("nb_participants_uniques"),
         )
-        .select_from(SessionActivite)
-        .join(AtelierActivite, SessionActivite.atelier_id == AtelierActivite.id)
-        .outerjoin(PresenceActivite, PresenceActivite.session_id == SessionActivite.id)
+        .select_from(fs)
+        .join(AtelierActivite, fs.c.atelier_id == AtelierActivite.id)
+        .outerjoin(PresenceActivite, PresenceActivite.session_id == fs.c.id)
     )
-    sector_rows = _apply_common_filters(sector_rows, flt)
     sector_rows = (
         sector_rows.group_by(AtelierActivite.secteur)
         .order_by(AtelierActivite.secteur.asc())
@@ -912,21 +962,24 @@ def compute_magatomatique(
             AtelierActivite.id.label("atelier_id"),
             AtelierActivite.nom.label("atelier_nom"),
             AtelierActivite.secteur.label("secteur"),
-            func.count(func.distinct(SessionActivite.id)).label("nb_sessions"),
+            func.count(func.distinct(fs.c.id)).label("nb_sessions"),
             func.count(PresenceActivite.id).label("nb_presences"),
-            func.count(func.distinct(PresenceActivite.participant_id)).label("nb_participants_uniques"),
         )
-        .select_from(SessionActivite)
-        .join(AtelierActivite, SessionActivite.atelier_id == AtelierActivite.id)
-        .outerjoin(PresenceActivite, PresenceActivite.session_id == SessionActivite.id)
+        .select_from(fs)
+        .join(AtelierActivite, fs.c.atelier_id == AtelierActivite.id)
+        .outerjoin(PresenceActivite, PresenceActivite.session_id == fs.c.id)
     )
-    atelier_rows = _apply_common_filters(atelier_rows, flt)
     atelier_rows = (
         atelier_rows.group_by(AtelierActivite.id, AtelierActivite.nom, AtelierActivite.secteur)
         .order_by(AtelierActivite.secteur.asc(), AtelierActivite.nom.asc())
         .all()
     )
 
+    # Participants uniques : DISTINCT (groupe, participant) calculé une fois en amont,
+    # puis simple COUNT(*) par groupe (pas de COUNT(DISTINCT) sur la jointure complète).
+    uniq_by_secteur = _count_unique_participants(fs, AtelierActivite.secteur) if sector_rows else {}
+    uniq_by_atelier = _count_unique_participants(fs, AtelierActivite.id) if atelier_rows else {}
+
     macro = {
         "kpis": {},
         "by_secteur": [
@@ -934,7 +987,7 @@ def compute_magatomatique(
                 "secteur": r.secteur,
                 "nb_sessions": int(r.nb_sessions or 0),
                 "nb_presences": int(r.nb_presences or 0),
-                "nb_participants_uniques": int(r.nb_participants_uniques or 0),
+                "nb_participants_uniques": uniq_by_secteur.get(r.secteur, 0),
             }
             for r in sector_rows
         ],
@@ -945,29 +998,31 @@ def compute_magatomatique(
                 "secteur": r.secteur,
                 "nb_sessions": int(r.nb_sessions or 0),
                 "nb_presences": int(r.nb_presences or 0),
-                "nb_participants_uniques": int(r.nb_participants_uniques or 0),
+                "nb_participants_uniques": uniq_by_atelier.get(r.atelier_id, 0),
             }
             for r in atelier_rows
         ],
     }
 
-    # KPIs globaux (périmètre filtré)
-    total_sessions = sum(int(r["nb_sessions"]) for r in macro["by_atelier"])
-    total_presences = sum(int(r["nb_presences"]) for r in macro["by_atelier"])
-    # participants uniques globaux (ne pas sommer par atelier, sinon doublons)
-    uniq_q = (
-        db.session.query(func.count(func.distinct(PresenceActivite.participant_id)))
-        .select_from(PresenceActivite)
-        .join(SessionActivite, PresenceActivite.session_id == SessionActivite.id)
-        .join(AtelierActivite, SessionActivite.atelier_id == AtelierActivite.id)
+    # KPIs globaux (périmètre filtré) : une seule requête pour les 3 totaux
+    # (participants uniques globaux : ne pas sommer par atelier, sinon doublons)
+    totals_q = (
+        db.session.query(
+            func.count(func.distinct(fs.c.id)),
+            func.count(PresenceActivite.id),
+            func.count(func.distinct(PresenceActivite.participant_id)),
+        )
+        .select_from(fs)
+        .outerjoin(PresenceActivite, PresenceActivite.session_id == fs.c.id)
     )
-    uniq_q = _apply_common_filters(uniq_q, flt)
-    total_participants_uniques = int(uniq_q.scalar() or 0)
+    total_sessions, total_presences, total_participants_uniques = totals_q.one()
+    total_sessions = int(total_sessions or 0)
+    total_presences = int(total_presences or 0)
 
     macro["kpis"] = {
-        "total_sessions": int(total_sessions),
-        "total_presences": int(total_presences),
-        "total_participants_uniques": int(total_participants_uniques),
+        "total_sessions": total_sessions,
+        "total_presences": total_presences,
+        "total_participants_uniques": int(total_participants_uniques or 0),
         "avg_presences_per_session": (float(total_presences) / float(total_sessions)) if total_sessions else 0.0,
     }
 
@@ -978,14 +1033,18 @@ def compute_magatomatique(
     # ===== Participants + (option) matrice =====
     # Sessions (pour la matrice) : tri chronologique
     # On récupère un peu plus pour ne pas exploser le navigateur.
-    sess_q = base_q
-    # Note: date (rdv_date ou date_session) - on utilise l'expression déjà utilisée ailleurs
-    sess_q = sess_q.order_by(_session_date_expr().asc(), SessionActivite.id.asc())
+    sess_q = (
+        db.session.query(SessionActivite, AtelierActivite)
+        .join(fs, fs.c.id == SessionActivite.id)
+        .join(AtelierActivite, SessionActivite.atelier_id == AtelierActivite.id)
+    )
+    # Note: date (rdv_date ou date_session) - déjà calculée dans la CTE
+    sess_q = sess_q.order_by(fs.c.sdate.asc(), SessionActivite.id.asc())
     if max_sessions and max_sessions > 0:
         sess_q = sess_q.limit(max_sessions)
 
     sessions = []
-    for s, a in sess_q.all():
+    for s, a in sess_q.yield_per(2000):
         d = s.rdv_date or s.date_session
         sessions.append(
             {
@@ -1004,19 +1063,16 @@ def compute_magatomatique(
     part_q = (
         db.session.query(Participant)
         .join(PresenceActivite, PresenceActivite.participant_id == Participant.id)
-        .join(SessionActivite, PresenceActivite.session_id == SessionActivite.id)
-        .join(AtelierActivite, SessionActivite.atelier_id == AtelierActivite.id)
+        .join(fs, fs.c.id == PresenceActivite.session_id)
+        .options(selectinload(Participant.quartier))
     )
-    part_q = _apply_common_filters(part_q, flt)
 
     if participant_q:
         pq = participant_q.strip()
         if pq:
-            like = f"%{pq.lower()}%"
-            part_q = part_q.filter(
-                func.lower(func.coalesce(Participant.nom, "")).like(like)
-                | func.lower(func.coalesce(Participant.prenom, "")).like(like)
-            )
+            # ILIKE sans lower()/coalesce() : permet l'index trigram (Postgres)
+            like = f"%{pq}%"
+            part_q = part_q.filter(or_(Participant.nom.ilike(like), Participant.prenom.ilike(like)))
 
     part_q = part_q.distinct().order_by(Participant.nom.asc(), Participant.prenom.asc())
     if max_participants and max_participants > 0:
@@ -1033,17 +1089,15 @@ def compute_magatomatique(
         db.session.query(
             PresenceActivite.participant_id.label("pid"),
             func.count(PresenceActivite.id).label("nb_presences"),
-            func.min(_session_date_expr()).label("first_date"),
-            func.max(_session_date_expr()).label("last_date"),
+            func.min(fs.c.sdate).label("first_date"),
+            func.max(fs.c.sdate).label("last_date"),
         )
         .select_from(PresenceActivite)
-        .join(SessionActivite, PresenceActivite.session_id == SessionActivite.id)
-        .join(AtelierActivite, SessionActivite.atelier_id == AtelierActivite.id)
+        .join(fs, fs.c.id == PresenceActivite.session_id)
     )
-    counts_q = _apply_common_filters(counts_q, flt)
     if participant_ids:
         counts_q = counts_q.filter(PresenceActivite.participant_id.in_(participant_ids))
-    counts_q = counts_q.group_by(PresenceActivite.participant_id).all()
+    counts_q = counts_q.group_by(PresenceActivite.participant_id).yield_per(2000)
 
     counts_map = {
         int(r.pid): {"nb_presences": int(r.nb_presences or 0), "first_date": r.first_date, "last_date": r.last_date}
@@ -1101,7 +1155,7 @@ def compute_magatomatique(
             .filter(PresenceActivite.session_id.in_(session_ids))
             .filter(PresenceActivite.participant_id.in_(participant_ids))
         )
-        for pid, sid in pres_q.all():
+        for pid, sid in pres_q.yield_per(2000):
             matrix[(int(pid), int(sid))] = 1
 
     return {
@@ -1,9 +1,13 @@
 from __future__ import annotations
 
+import threading
+import time
 from collections import Counter, defaultdict
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional
 
-from sqlalchemy import func
+from flask import current_app
+from sqlalchemy import column, event, func, select, table, text
+from sqlalchemy.orm import Session
 
 from app.extensions import db
 from app.models import AtelierActivite, PresenceActivite, SessionActivite
@@ -11,22 +15,175 @@ from app.models import AtelierActivite, PresenceActivite, SessionActivite
 
 DEFAULT_COLLECTIF_CAPACITY = 12
 
+# ---------------------------
+# Vue matérialisée (Postgres) : 1 ligne par session non supprimée, avec la
+# capacité brute (session puis atelier) et le nombre de présences.
+# Créée par ensure_schema, rafraîchie hors requête par un thread de fond
+# (start_occupancy_refresher) quand une session / présence / un atelier a été
+# modifié : les lectures ne la rafraîchissent jamais et peuvent donc avoir
+# jusqu'à OCCUPANCY_REFRESH_SECONDS de retard.
+# ---------------------------
 
-def _session_date_expr():
-    # Use rdv_date for individuel, date_session for collectif
-    return func.coalesce(SessionActivite.rdv_date, SessionActivite.date_session)
+OCCUPANCY_VIEW = "mv_session_occupancy"
 
+OCCUPANCY_VIEW_DDL = [
+    f"""
+    CREATE MATERIALIZED VIEW IF NOT EXISTS {OCCUPANCY_VIEW} AS
+    SELECT
+        s.id AS sid,
+        s.atelier_id AS atelier_id,
+        s.secteur AS secteur,
+        s.session_type AS session_type,
+        COALESCE(s.rdv_date, s.date_session) AS sdate,
+        COALESCE(s.capacite, a.capacite_defaut) AS capacity,
+        (SELECT COUNT(*) FROM presence_activite p WHERE p.session_id = s.id) AS pres,
+        a.secteur AS atelier_secteur,
+        a.nom AS atelier_nom
+    FROM session_activite s
+    JOIN atelier_activite a ON a.id = s.atelier_id
+    WHERE s.is_deleted = false AND a.is_deleted = false
+    """,
+    f"CREATE UNIQUE INDEX IF NOT EXISTS {OCCUPANCY_VIEW}_sid ON {OCCUPANCY_VIEW} (sid)",
+    f"CREATE INDEX IF NOT EXISTS {OCCUPANCY_VIEW}_atelier_sdate ON {OCCUPANCY_VIEW} (atelier_id, sdate)",
+]
 
-def compute_occupancy_stats(flt) -> Dict[str, Any]:
-    """Compute occupancy / fill-rate stats for COLLECTIF sessions only.
+_occupancy_view = table(
+    OCCUPANCY_VIEW,
+    column("sid"),
+    column("atelier_id"),
+    column("secteur"),
+    column("session_type"),
+    column("sdate"),
+    column("capacity"),
+    column("pres"),
+    column("atelier_secteur"),
+    column("atelier_nom"),
+)
 
-    Rules:
-    - Only sessions with session_type == 'COLLECTIF' are considered.
-    - capacity_effective = session.capacite if set else atelier.capacite_defaut if set else DEFAULT_COLLECTIF_CAPACITY.
-    - RDV / individuel sessions are excluded (as requested).
+_view_state = {"available": None, "stale": True, "refresher": None}
 
-    Returns safe aggregated numbers (no participant identities).
+_VIEW_SOURCES = (SessionActivite, PresenceActivite, AtelierActivite)
+_VIEW_SOURCE_TABLES = frozenset(m.__table__.name for m in _VIEW_SOURCES)
+
+
+@event.listens_for(Session, "after_flush")
+def _flag_occupancy_changes(session, _flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, _VIEW_SOURCES):
+            session.info["occupancy_stale"] = True
+            return
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _flag_occupancy_bulk_writes(orm_execute_state):
+    # UPDATE / DELETE en masse (query.delete(), delete(Model), Table.delete()...) :
+    # invisibles pour after_flush, pris en compte au commit comme les autres écritures.
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    target = getattr(orm_execute_state.statement, "table", None)
+    if getattr(target, "name", None) in _VIEW_SOURCE_TABLES:
+        orm_execute_state.session.info["occupancy_stale"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _mark_view_stale_on_commit(session):
+    # Marqué après le commit seulement : un rafraîchissement concurrent ne doit
+    # pas "consommer" le flag avant que les données soient visibles.
+    if session.info.pop("occupancy_stale", False):
+        mark_occupancy_view_stale()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_view_changes_on_rollback(session):
+    session.info.pop("occupancy_stale", None)
+
+
+def mark_occupancy_view_stale() -> None:
+    """A appeler après une écriture hors Session (SQL brut, autre connexion...)."""
+    _view_state["stale"] = True
+
+
+def _occupancy_view_available() -> bool:
+    if _view_state["available"] is None:
+        if db.engine.dialect.name != "postgresql":
+            _view_state["available"] = False
+        else:
+            try:
+                found = db.session.execute(text("SELECT to_regclass(:n)"), {"n": OCCUPANCY_VIEW}).scalar()
+            except Exception:
+                # Erreur passagère : rien n'est mis en cache, on retentera au prochain appel
+                db.session.rollback()
+                return False
+            _view_state["available"] = found is not None
+    return bool(_view_state["available"])
+
+
+def refresh_occupancy_view() -> bool:
+    """Rafraîchit la vue si une écriture l'a rendue obsolète ; True si rafraîchie.
+
+    Recalcule toutes les sessions : à appeler hors requête (thread de fond).
+    """
+    if not _view_state["stale"]:
+        return False
+    # Remis à False avant le rafraîchissement : une écriture validée pendant
+    # celui-ci re-marque la vue, qui sera rafraîchie au passage suivant.
+    _view_state["stale"] = False
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {OCCUPANCY_VIEW}"))
+    except Exception:
+        _view_state["stale"] = True
+        raise
+    return True
+
+
+def start_occupancy_refresher(app) -> None:
+    """Démarre le thread qui rafraîchit la vue toutes les OCCUPANCY_REFRESH_SECONDS.
+
+    À appeler dans un contexte d'application. Sans effet hors Postgres, si la vue
+    n'existe pas ou si l'intervalle vaut 0.
     """
+    interval = int(app.config.get("OCCUPANCY_REFRESH_SECONDS") or 0)
+    if interval <= 0 or _view_state["refresher"] is not None or not _occupancy_view_available():
+        return
+
+    def _run():
+        while True:
+            with app.app_context():
+                try:
+                    refresh_occupancy_view()
+                except Exception:
+                    app.logger.exception("Rafraîchissement de %s impossible", OCCUPANCY_VIEW)
+            time.sleep(interval)
+
+    _view_state["refresher"] = threading.Thread(target=_run, name="occupancy-refresh", daemon=True)
+    _view_state["refresher"].start()
+
+
+def _session_date_expr():
+    # Use rdv_date for individuel, date_session for collectif (generated column)
+    return SessionActivite.session_effective_date
+
+
+def _occupancy_rows_from_view(flt):
+    """Rows (atelier_id, atelier_secteur, atelier_nom, capacity, pres) from the materialized view."""
+    v = _occupancy_view.c
+    q = select(v.atelier_id, v.atelier_secteur, v.atelier_nom, v.capacity, v.pres)
+    if getattr(flt, "secteur", None):
+        q = q.where(v.secteur == flt.secteur)
+    if getattr(flt, "atelier_id", None):
+        q = q.where(v.atelier_id == flt.atelier_id)
+    if getattr(flt, "date_from", None):
+        q = q.where(v.sdate >= flt.date_from)
+    if getattr(flt, "date_to", None):
+        q = q.where(v.sdate <= flt.date_to)
+    q = q.where(v.session_type == "COLLECTIF")
+    # Exécutée ici, pas à l'itération : une erreur de lecture reste dans le try de l'appelant
+    return db.session.execute(q, execution_options={"yield_per": 2000})
+
+
+def _occupancy_rows_from_tables(flt):
+    """Same rows as _occupancy_rows_from_view, computed from the base tables (SQLite / no view)."""
 
     # Sessions in scope (reuse common filters if present; otherwise implement here)
     q = db.session.query(SessionActivite, AtelierActivite).join(
@@ -52,27 +209,43 @@ def compute_occupancy_stats(flt) -> Dict[str, Any]:
     # Only collectif
     q = q.filter(SessionActivite.session_type == "COLLECTIF")
 
-    sessions_rows: List[Tuple[SessionActivite, AtelierActivite]] = q.all()
-    if not sessions_rows:
-        return {
-            "collective_sessions": 0,
-            "collective_presences": 0,
-            "avg_fill_rate_pct": None,
-            "buckets": {"<50%": 0, "50-79%": 0, "80-99%": 0, "100%+": 0},
-            "per_atelier": [],
-        }
+    # Presences per session (aggregated in SQL over the same scope, no id list in Python)
+    pres_q = (
+        q.with_entities(PresenceActivite.session_id, func.count(PresenceActivite.id))
+        .join(PresenceActivite, PresenceActivite.session_id == SessionActivite.id)
+        .group_by(PresenceActivite.session_id)
+    )
+    pres_by_session = Counter({sid: int(n) for sid, n in pres_q.yield_per(2000)})
 
-    session_ids = [s.id for s, _a in sessions_rows]
+    for session, atelier in q.yield_per(2000):
+        cap = session.capacite if session.capacite is not None else atelier.capacite_defaut
+        yield atelier.id, atelier.secteur, atelier.nom, cap, pres_by_session.get(session.id, 0)
 
-    # Presences per session
-    pres_rows = (
-        db.session.query(PresenceActivite.session_id)
-        .filter(PresenceActivite.session_id.in_(session_ids))
-        .all()
-    )
-    pres_by_session = Counter([sid for (sid,) in pres_rows])
 
-    total_presences = sum(pres_by_session.values())
+def compute_occupancy_stats(flt) -> Dict[str, Any]:
+    """Compute occupancy / fill-rate stats for COLLECTIF sessions only.
+
+    Rules:
+    - Only sessions with session_type == 'COLLECTIF' are considered.
+    - capacity_effective = session.capacite if set else atelier.capacite_defaut if set else DEFAULT_COLLECTIF_CAPACITY.
+    - RDV / individuel sessions are excluded (as requested).
+
+    Reads the mv_session_occupancy materialized view on Postgres (as last refreshed by the
+    background job), the base tables otherwise or if the view cannot be read.
+
+    Returns safe aggregated numbers (no participant identities).
+    """
+    rows = None
+    if _occupancy_view_available():
+        try:
+            rows = _occupancy_rows_from_view(flt)
+        except Exception:
+            # Vue illisible (droits, vue supprimée...) : les tables restent la source
+            # de vérité, la vue sera retentée au prochain appel.
+            db.session.rollback()
+            current_app.logger.exception("Lecture de %s impossible, calcul sur les tables", OCCUPANCY_VIEW)
+    if rows is None:
+        rows = _occupancy_rows_from_tables(flt)
 
     # Compute fill rates
     fill_rates: List[float] = []
@@ -89,12 +262,15 @@ def compute_occupancy_stats(flt) -> Dict[str, Any]:
         "fill_rates": [],
     })
 
-    for session, atelier in sessions_rows:
-        cap = session.capacite if session.capacite is not None else atelier.capacite_defaut
+    sessions_count = 0
+    total_presences = 0
+    for atelier_id, atelier_secteur, atelier_nom, cap, pres in rows:
+        sessions_count += 1
         if cap is None or cap <= 0:
             cap = DEFAULT_COLLECTIF_CAPACITY
 
-        pres = int(pres_by_session.get(session.id, 0))
+        pres = int(pres or 0)
+        total_presences += pres
         rate = (pres / float(cap)) if cap else 0.0
         fill_rates.append(rate)
 
@@ -108,15 +284,24 @@ def compute_occupancy_stats(flt) -> Dict[str, Any]:
         else:
             bucket_counts["100%+"] += 1
 
-        a = per_atelier[atelier.id]
-        a["atelier_id"] = atelier.id
-        a["secteur"] = atelier.secteur
-        a["nom"] = atelier.nom
+        a = per_atelier[atelier_id]
+        a["atelier_id"] = atelier_id
+        a["secteur"] = atelier_secteur
+        a["nom"] = atelier_nom
         a["sessions"] += 1
         a["presences"] += pres
         a["capacity_total"] += int(cap)
         a["fill_rates"].append(rate)
 
+    if not sessions_count:
+        return {
+            "collective_sessions": 0,
+            "collective_presences": 0,
+            "avg_fill_rate_pct": None,
+            "buckets": {"<50%": 0, "50-79%": 0, "80-99%": 0, "100%+": 0},
+            "per_atelier": [],
+        }
+
     avg_fill = (sum(fill_rates) / len(fill_rates)) if fill_rates else 0.0
 
     per_atelier_list = []
@@ -136,7 +321,7 @@ def compute_occupancy_stats(flt) -> Dict[str, Any]:
     per_atelier_list.sort(key=lambda x: (-x["avg_fill_rate_pct"], -x["sessions"], x["nom"]))
 
     return {
-        "collective_sessions": len(sessions_rows),
+        "collective_sessions": sessions_count,
         "collective_presences": int(total_presences),
         "avg_fill_rate_pct": round(avg_fill * 100.0, 1),
         "buckets": dict(bucket_counts),
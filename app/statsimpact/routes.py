@@ -1,17 +1,24 @@
 from __future__ import annotations
 
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import date
-from io import BytesIO, StringIO
+from functools import lru_cache
+from io import StringIO
 import csv
 
 import os
+import tempfile
+import threading
+import time
+import zlib
 
-from flask import Blueprint, abort, render_template, request, redirect, url_for, flash, current_app, send_file, Response
+from flask import Blueprint, abort, render_template, request, redirect, url_for, flash, current_app, send_file, Response, stream_with_context, copy_current_request_context
 from flask_login import login_required, current_user
 from app.rbac import can
 
-from sqlalchemy import func
-from sqlalchemy.orm import joinedload
+from sqlalchemy import case, event, func, or_
+from sqlalchemy.orm import Session, load_only, raiseload, selectinload
 
 from openpyxl import Workbook
 from openpyxl.utils import get_column_letter
@@ -44,6 +51,7 @@ from .engine import (
     compute_participants_stats,
     compute_magatomatique,
     normalize_filters,
+    participant_in_scope,
     _apply_common_filters,
     _session_date_expr,
     _session_duration_minutes,
@@ -118,56 +126,153 @@ def _fmt_datetime(value) -> str:
     return value.strftime("%Y-%m-%d %H:%M") if value else ""
 
 
+# Colonnes exportables : libellé + expression Python sur une ligne de
+# _query_presence_export (pr=présence, p=participant, s=session, a=atelier,
+# q=nom du quartier), compilée par _compile_csv_row.
 CSV_FIELD_MAP = {
-    "participant_id": {"label": "ID participant", "getter": lambda ctx: ctx["participant"].id},
-    "participant_nom": {"label": "Nom", "getter": lambda ctx: ctx["participant"].nom or ""},
-    "participant_prenom": {"label": "Prénom", "getter": lambda ctx: ctx["participant"].prenom or ""},
-    "participant_email": {"label": "Email", "getter": lambda ctx: ctx["participant"].email or ""},
-    "participant_telephone": {"label": "Téléphone", "getter": lambda ctx: ctx["participant"].telephone or ""},
-    "participant_ville": {"label": "Ville", "getter": lambda ctx: ctx["participant"].ville or ""},
-    "participant_quartier": {
-        "label": "Quartier",
-        "getter": lambda ctx: ctx["quartier"].nom if ctx["quartier"] else "",
-    },
-    "participant_genre": {"label": "Genre", "getter": lambda ctx: ctx["participant"].genre or ""},
-    "participant_type_public": {"label": "Type public", "getter": lambda ctx: ctx["participant"].type_public or ""},
-    "participant_date_naissance": {
-        "label": "Date naissance",
-        "getter": lambda ctx: _fmt_date(ctx["participant"].date_naissance),
-    },
-    "session_id": {"label": "ID session", "getter": lambda ctx: ctx["session"].id},
-    "session_date": {
-        "label": "Date session",
-        "getter": lambda ctx: _fmt_date(ctx["session"].rdv_date or ctx["session"].date_session),
-    },
-    "session_type": {"label": "Type session", "getter": lambda ctx: ctx["session"].session_type or ""},
-    "session_statut": {"label": "Statut session", "getter": lambda ctx: ctx["session"].statut or ""},
-    "session_heure_debut": {
-        "label": "Heure début",
-        "getter": lambda ctx: ctx["session"].rdv_debut or ctx["session"].heure_debut or "",
-    },
-    "session_heure_fin": {
-        "label": "Heure fin",
-        "getter": lambda ctx: ctx["session"].rdv_fin or ctx["session"].heure_fin or "",
-    },
-    "session_duree_minutes": {
-        "label": "Durée (minutes)",
-        "getter": lambda ctx: ctx["session"].duree_minutes or "",
-    },
-    "atelier_id": {"label": "ID atelier", "getter": lambda ctx: ctx["atelier"].id},
-    "atelier_nom": {"label": "Nom atelier", "getter": lambda ctx: ctx["atelier"].nom or ""},
-    "atelier_secteur": {"label": "Secteur atelier", "getter": lambda ctx: ctx["atelier"].secteur or ""},
-    "atelier_type": {"label": "Type atelier", "getter": lambda ctx: ctx["atelier"].type_atelier or ""},
-    "presence_id": {"label": "ID présence", "getter": lambda ctx: ctx["presence"].id},
-    "presence_motif": {"label": "Motif", "getter": lambda ctx: ctx["presence"].motif or ""},
-    "presence_motif_autre": {"label": "Motif autre", "getter": lambda ctx: ctx["presence"].motif_autre or ""},
-    "presence_created_at": {
-        "label": "Date d'émargement",
-        "getter": lambda ctx: _fmt_datetime(ctx["presence"].created_at),
-    },
+    "participant_id": {"label": "ID participant", "expr": "p.id"},
+    "participant_nom": {"label": "Nom", "expr": "p.nom or ''"},
+    "participant_prenom": {"label": "Prénom", "expr": "p.prenom or ''"},
+    "participant_email": {"label": "Email", "expr": "p.email or ''"},
+    "participant_telephone": {"label": "Téléphone", "expr": "p.telephone or ''"},
+    "participant_ville": {"label": "Ville", "expr": "p.ville or ''"},
+    "participant_quartier": {"label": "Quartier", "expr": "q or ''"},
+    "participant_genre": {"label": "Genre", "expr": "p.genre or ''"},
+    "participant_type_public": {"label": "Type public", "expr": "p.type_public or ''"},
+    "participant_date_naissance": {"label": "Date naissance", "expr": "_fmt_date(p.date_naissance)"},
+    "session_id": {"label": "ID session", "expr": "s.id"},
+    "session_date": {"label": "Date session", "expr": "_fmt_date(s.rdv_date or s.date_session)"},
+    "session_type": {"label": "Type session", "expr": "s.session_type or ''"},
+    "session_statut": {"label": "Statut session", "expr": "s.statut or ''"},
+    "session_heure_debut": {"label": "Heure début", "expr": "s.rdv_debut or s.heure_debut or ''"},
+    "session_heure_fin": {"label": "Heure fin", "expr": "s.rdv_fin or s.heure_fin or ''"},
+    "session_duree_minutes": {"label": "Durée (minutes)", "expr": "s.duree_minutes or ''"},
+    "atelier_id": {"label": "ID atelier", "expr": "a.id"},
+    "atelier_nom": {"label": "Nom atelier", "expr": "a.nom or ''"},
+    "atelier_secteur": {"label": "Secteur atelier", "expr": "a.secteur or ''"},
+    "atelier_type": {"label": "Type atelier", "expr": "a.type_atelier or ''"},
+    "presence_id": {"label": "ID présence", "expr": "pr.id"},
+    "presence_motif": {"label": "Motif", "expr": "pr.motif or ''"},
+    "presence_motif_autre": {"label": "Motif autre", "expr": "pr.motif_autre or ''"},
+    "presence_created_at": {"label": "Date d'émargement", "expr": "_fmt_datetime(pr.created_at)"},
 }
 
 
+CSV_WRITE_BATCH = 1000
+
+
+@lru_cache(maxsize=64)
+def _compile_csv_row(fields: tuple[str, ...]):
+    """
+    Compile une fonction row(pr, p, s, a, q) -> tuple dédiée aux colonnes demandées :
+    accès directs aux attributs, sans dict de contexte ni appel par champ.
+    `fields` doit être déjà filtré sur CSV_FIELD_MAP (seules ses expressions
+    sont injectées dans le code généré).
+    """
+    cells = "".join(CSV_FIELD_MAP[f]["expr"] + ", " for f in fields)
+    src = "def row(pr, p, s, a, q):\n    return (" + cells + ")\n"
+    ns = {"_fmt_date": _fmt_date, "_fmt_datetime": _fmt_datetime}
+    exec(compile(src, "<csv_row>", "exec"), ns)
+    return ns["row"]
+
+
+# ---------------------------
+# Listes des filtres (secteurs, années) : cache mémoire court, vidé dès
+# qu'un atelier (secteurs, années) ou une session (années) est créé / modifié /
+# supprimé dans ce processus.
+# ---------------------------
+
+SECTEURS_CACHE_TTL = 60.0
+_secteurs_cache: dict = {"value": None, "at": 0.0, "epoch": 0}
+_secteurs_lock = threading.Lock()
+
+YEARS_CACHE_TTL = 600.0
+# eff_secteur -> (années, horodatage)
+_years_cache: dict = {"values": {}, "epoch": 0}
+
+
+@event.listens_for(Session, "after_flush")
+def _flag_secteurs_changes(session, _flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, AtelierActivite):
+            session.info["secteurs_stale"] = True
+            session.info["years_stale"] = True
+            return
+        if isinstance(obj, SessionActivite):
+            session.info["years_stale"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _reset_secteurs_on_commit(session):
+    secteurs_stale = session.info.pop("secteurs_stale", False)
+    years_stale = session.info.pop("years_stale", False)
+    if not (secteurs_stale or years_stale):
+        return
+    with _secteurs_lock:
+        if secteurs_stale:
+            _secteurs_cache["epoch"] += 1
+            _secteurs_cache["value"] = None
+        if years_stale:
+            _years_cache["epoch"] += 1
+            _years_cache["values"] = {}
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_secteurs_changes_on_rollback(session):
+    session.info.pop("secteurs_stale", None)
+    session.info.pop("years_stale", None)
+
+
+def _active_secteurs() -> list[str]:
+    """Secteurs distincts des ateliers actifs (triés), mis en cache SECTEURS_CACHE_TTL secondes."""
+    with _secteurs_lock:
+        cached = _secteurs_cache["value"]
+        if cached is not None and time.monotonic() - _secteurs_cache["at"] < SECTEURS_CACHE_TTL:
+            return list(cached)
+        epoch = _secteurs_cache["epoch"]
+    value = [
+        s[0]
+        for s in (
+            AtelierActivite.query.with_entities(AtelierActivite.secteur)
+            .filter(AtelierActivite.is_deleted.is_(False))
+            .distinct()
+            .order_by(AtelierActivite.secteur.asc())
+            .all()
+        )
+        if s and s[0]
+    ]
+    with _secteurs_lock:
+        # Un atelier modifié pendant la lecture : ne pas mettre en cache une liste périmée
+        if _secteurs_cache["epoch"] == epoch:
+            _secteurs_cache["value"] = tuple(value)
+            _secteurs_cache["at"] = time.monotonic()
+    return value
+
+
+def _available_years(eff_secteur: str | None) -> list[int]:
+    """Années (décroissantes) ayant au moins une session, mises en cache YEARS_CACHE_TTL secondes."""
+    with _secteurs_lock:
+        cached = _years_cache["values"].get(eff_secteur)
+        if cached is not None and time.monotonic() - cached[1] < YEARS_CACHE_TTL:
+            return list(cached[0])
+        epoch = _years_cache["epoch"]
+    # Sur la colonne générée : (atelier_id, date effective) lus dans session_atelier_eff_date
+    year_expr = func.extract("year", _session_date_expr())
+    years_q = (
+        db.session.query(year_expr.label("y"))
+        .select_from(SessionActivite)
+        .join(AtelierActivite, SessionActivite.atelier_id == AtelierActivite.id)
+        .filter(AtelierActivite.is_deleted.is_(False))
+    )
+    if eff_secteur:
+        years_q = years_q.filter(AtelierActivite.secteur == eff_secteur)
+    value = [int(r.y) for r in years_q.distinct().order_by(year_expr.desc()).all() if r and r.y]
+    with _secteurs_lock:
+        if _years_cache["epoch"] == epoch:
+            _years_cache["values"][eff_secteur] = (tuple(value), time.monotonic())
+    return value
+
+
 def _can_view() -> bool:
     return can("statsimpact:view") or can("statsimpact:view_all")
 
@@ -182,6 +287,78 @@ def _safe_sheet_title(name: str, fallback: str = "Atelier") -> str:
     return cleaned
 
 
+# Lettres de colonnes Excel (A..XFD) précalculées : COL_LETTERS[idx - 1]
+COL_LETTERS = tuple(get_column_letter(i) for i in range(1, 16385))
+
+
+def _set_col_widths(ws, first: int, last: int, width: float) -> None:
+    """Même largeur sur les colonnes first..last (1-indexées) : une seule entrée <col min max>."""
+    if last < first:
+        return
+    dim = ws.column_dimensions[COL_LETTERS[first - 1]]
+    dim.width = width
+    dim.min, dim.max = first, last
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def _xlsx_response(wb: Workbook, filename: str) -> Response:
+    """
+    Envoie le classeur par morceaux de 64 Ko. Le zip est sérialisé dans un
+    SpooledTemporaryFile (RAM jusqu'à 8 Mo, disque au-delà) plutôt qu'un BytesIO.
+    """
+    tmp = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    try:
+        wb.save(tmp)
+    except Exception:
+        tmp.close()
+        raise
+    size = tmp.tell()
+    tmp.seek(0)
+
+    def _gen():
+        try:
+            while True:
+                chunk = tmp.read(64 * 1024)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            tmp.close()
+
+    # Pas de gzip : un .xlsx est déjà une archive zip compressée
+    resp = Response(_gen(), mimetype=XLSX_MIME)
+    resp.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    resp.headers["Content-Length"] = str(size)
+    resp.headers["Cache-Control"] = EXPORT_CACHE_CONTROL
+    return resp
+
+
+# ---------------------------
+# Compression gzip (waitress ne compresse pas) : export CSV en flux uniquement.
+# Pas de gzip des pages HTML : elles embarquent le jeton CSRF (layout.html) à côté
+# de valeurs reprises de l'URL (filtres, recherche), cf. attaque BREACH sous HTTPS.
+# Les exports contiennent des données personnelles : jamais en cache.
+# ---------------------------
+
+EXPORT_CACHE_CONTROL = "private, no-store"
+GZIP_LEVEL = 6
+
+
+def _accepts_gzip() -> bool:
+    return request.accept_encodings["gzip"] > 0
+
+
+def _gzip_stream(chunks):
+    """Compresse un flux de morceaux texte au fil de l'eau (format gzip, mémoire bornée)."""
+    z = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = z.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield z.flush()
+
+
 def _pedago_scope_secteur() -> str | None:
     if can("scope:all_secteurs"):
         return None
@@ -221,47 +398,110 @@ def _build_bilan_rows(participant: Participant) -> list[dict]:
     return rows
 
 
-def _participants_success_rate(session_id: int, competences: list[Competence]) -> dict:
+def _participants_success_rate(session_id: int, competences: list[Competence], preloaded: dict | None = None) -> dict:
     if not competences:
         return {"total": 0, "success": 0, "ratio": 0}
-    presences = PresenceActivite.query.filter_by(session_id=session_id).all()
+    comp_ids = [c.id for c in competences]
+    if preloaded is not None:
+        # Données déjà chargées pour tout l'arbre (cf. _preload_success_data)
+        presences = [(pid,) for pid in preloaded["presences"].get(session_id, [])]
+        wanted = set(comp_ids)
+        counts = {
+            pid: len(wanted & preloaded["acquired"].get((session_id, pid), set()))
+            for (pid,) in presences
+        }
+    else:
+        presences = PresenceActivite.query.filter_by(session_id=session_id).with_entities(PresenceActivite.participant_id).all()
+        counts = {}
+        if presences:
+            # Nb de compétences acquises par participant : une seule requête groupée
+            rows = (
+                db.session.query(Evaluation.participant_id, func.count(func.distinct(Evaluation.competence_id)))
+                .filter(
+                    Evaluation.session_id == session_id,
+                    Evaluation.competence_id.in_(comp_ids),
+                    Evaluation.etat >= 2,
+                )
+                .group_by(Evaluation.participant_id)
+                .all()
+            )
+            counts = dict(rows)
     total = len(presences)
     if total == 0:
         return {"total": 0, "success": 0, "ratio": 0}
-    comp_ids = [c.id for c in competences]
-    success_count = 0
-    for pr in presences:
-        evals = (
-            Evaluation.query.filter(
-                Evaluation.session_id == session_id,
-                Evaluation.participant_id == pr.participant_id,
-                Evaluation.competence_id.in_(comp_ids),
-                Evaluation.etat >= 2,
-            )
-            .distinct()
-            .count()
-        )
-        if evals == len(comp_ids):
-            success_count += 1
+    success_count = sum(1 for (pid,) in presences if counts.get(pid, 0) == len(comp_ids))
     ratio = (success_count / total * 100) if total else 0
     return {"total": total, "success": success_count, "ratio": ratio}
 
 
-def _objective_success(obj: Objectif) -> dict:
+def _preload_success_data(objectifs: list[Objectif]) -> dict:
+    """
+    Charge en 2 requêtes les présences et les compétences acquises (etat >= 2)
+    de toutes les séances des objectifs opérationnels des arbres donnés.
+    """
+    session_ids: set[int] = set()
+    seen: set[int] = set()
+    stack = list(objectifs)
+    while stack:
+        obj = stack.pop()
+        if obj.id in seen:
+            continue
+        seen.add(obj.id)
+        if obj.type == "operationnel" and obj.session_id:
+            session_ids.add(obj.session_id)
+        else:
+            stack.extend(obj.enfants or [])
+
+    data: dict = {"presences": defaultdict(list), "acquired": defaultdict(set)}
+    if not session_ids:
+        return data
+    for sid, pid in (
+        db.session.query(PresenceActivite.session_id, PresenceActivite.participant_id)
+        .filter(PresenceActivite.session_id.in_(session_ids))
+        .all()
+    ):
+        data["presences"][sid].append(pid)
+    for sid, pid, cid in (
+        db.session.query(Evaluation.session_id, Evaluation.participant_id, Evaluation.competence_id)
+        .filter(Evaluation.session_id.in_(session_ids), Evaluation.etat >= 2)
+        .distinct()
+        .all()
+    ):
+        data["acquired"][(sid, pid)].add(cid)
+    return data
+
+
+def _objective_success(obj: Objectif, cache: dict | None = None, preloaded: dict | None = None) -> dict:
+    """
+    Taux de réussite d'un objectif (récursif sur les enfants).
+    cache: {objectif_id: résultat}, partagé le temps d'une requête HTTP pour ne
+    pas recalculer un sous-arbre atteint plusieurs fois.
+    """
+    if cache is None:
+        cache = {}
+    if obj.id in cache:
+        return cache[obj.id]
+
     if obj.type == "operationnel" and obj.session_id:
-        stats = _participants_success_rate(obj.session_id, obj.competences)
+        stats = _participants_success_rate(obj.session_id, obj.competences, preloaded)
         validated = stats["ratio"] >= (obj.seuil_validation or 0)
-        return {"ratio": stats["ratio"], "validated": validated, "total": stats["total"], "success": stats["success"]}
+        result = {"ratio": stats["ratio"], "validated": validated, "total": stats["total"], "success": stats["success"]}
+        cache[obj.id] = result
+        return result
 
     enfants = obj.enfants or []
     if not enfants:
-        return {"ratio": 0, "validated": False, "total": 0, "success": 0}
-    results = [ _objective_success(child) for child in enfants ]
+        result = {"ratio": 0, "validated": False, "total": 0, "success": 0}
+        cache[obj.id] = result
+        return result
+    results = [ _objective_success(child, cache, preloaded) for child in enfants ]
     total = len(results)
     success = sum(1 for r in results if r["validated"])
     ratio = (success / total * 100) if total else 0
     validated = ratio >= (obj.seuil_validation or 0)
-    return {"ratio": ratio, "validated": validated, "total": total, "success": success}
+    result = {"ratio": ratio, "validated": validated, "total": total, "success": success}
+    cache[obj.id] = result
+    return result
 
 
 def _query_presence_export(flt, participant_q: str | None = None):
@@ -271,21 +511,50 @@ def _query_presence_export(flt, participant_q: str | None = None):
             Participant,
             SessionActivite,
             AtelierActivite,
-            Quartier,
+            Quartier.nom.label("quartier_nom"),
         )
         .join(Participant, PresenceActivite.participant_id == Participant.id)
         .join(SessionActivite, PresenceActivite.session_id == SessionActivite.id)
         .join(AtelierActivite, SessionActivite.atelier_id == AtelierActivite.id)
         .outerjoin(Quartier, Participant.quartier_id == Quartier.id)
+        # Seules les colonnes exportables (cf. CSV_FIELD_MAP) sont chargées, et tout
+        # chargement paresseux (colonne ou relation) lève une erreur : une ligne = zéro requête en plus
+        .options(
+            load_only(PresenceActivite.id, PresenceActivite.motif, PresenceActivite.motif_autre, PresenceActivite.created_at, raiseload=True),
+            load_only(
+                Participant.id,
+                Participant.nom,
+                Participant.prenom,
+                Participant.email,
+                Participant.telephone,
+                Participant.ville,
+                Participant.genre,
+                Participant.type_public,
+                Participant.date_naissance,
+                raiseload=True,
+            ),
+            load_only(
+                SessionActivite.id,
+                SessionActivite.session_type,
+                SessionActivite.statut,
+                SessionActivite.date_session,
+                SessionActivite.heure_debut,
+                SessionActivite.heure_fin,
+                SessionActivite.rdv_date,
+                SessionActivite.rdv_debut,
+                SessionActivite.rdv_fin,
+                SessionActivite.duree_minutes,
+                raiseload=True,
+            ),
+            load_only(AtelierActivite.id, AtelierActivite.nom, AtelierActivite.secteur, AtelierActivite.type_atelier, raiseload=True),
+            raiseload("*"),
+        )
     )
     query = _apply_common_filters(query, flt)
 
     if participant_q:
-        like = f"%{participant_q.lower()}%"
-        query = query.filter(
-            func.lower(func.coalesce(Participant.nom, "")).like(like)
-            | func.lower(func.coalesce(Participant.prenom, "")).like(like)
-        )
+        like = f"%{participant_q}%"
+        query = query.filter(or_(Participant.nom.ilike(like), Participant.prenom.ilike(like)))
 
     query = query.order_by(_session_date_expr().asc(), Participant.nom.asc(), Participant.prenom.asc())
     return query
@@ -323,19 +592,44 @@ def stats_pedagogie():
 
     participant = Participant.query.get(participant_id) if participant_id else None
 
-    projet_objectifs = []
+    # Arbres d'objectifs chargés en entier (un SELECT ... IN par niveau, compétences
+    # comprises) : le calcul récursif ne déclenche plus aucun lazy load.
+    tree_options = (
+        selectinload(Objectif.enfants, recursion_depth=-1).selectinload(Objectif.competences),
+        selectinload(Objectif.competences),
+    )
+    projet_roots = []
     if projet:
-        objectifs = Objectif.query.filter_by(projet_id=projet.id, type="general").order_by(Objectif.created_at.asc()).all()
-        for obj in objectifs:
-            stats = _objective_success(obj)
-            projet_objectifs.append({"objectif": obj, **stats})
+        projet_roots = (
+            Objectif.query.options(*tree_options)
+            .filter_by(projet_id=projet.id, type="general")
+            .order_by(Objectif.created_at.asc())
+            .all()
+        )
+    atelier_roots = []
+    if atelier:
+        atelier_roots = (
+            Objectif.query.options(*tree_options)
+            .filter_by(atelier_id=atelier.id, type="specifique")
+            .order_by(Objectif.created_at.asc())
+            .all()
+        )
+
+    # Résultats mémoïsés pour la requête (un objectif spécifique peut être atteint
+    # via son objectif général ET via l'atelier) + données de réussite préchargées.
+    success_cache: dict = {}
+    preloaded = _preload_success_data(projet_roots + atelier_roots)
+
+    projet_objectifs = []
+    for obj in projet_roots:
+        stats = _objective_success(obj, success_cache, preloaded)
+        projet_objectifs.append({"objectif": obj, **stats})
 
     atelier_stats = {}
     if atelier:
-        objectifs = Objectif.query.filter_by(atelier_id=atelier.id, type="specifique").order_by(Objectif.created_at.asc()).all()
         objectifs_stats = []
-        for obj in objectifs:
-            stats = _objective_success(obj)
+        for obj in atelier_roots:
+            stats = _objective_success(obj, success_cache, preloaded)
             objectifs_stats.append({"objectif": obj, **stats})
         atelier_stats = {"objectifs": objectifs_stats}
 
@@ -398,6 +692,23 @@ def _quartier_bucket(name: str | None) -> str:
     return "Autres"
 
 
+def _age_years_expr(birth_col, today: date):
+    """Âge révolu à la date `today` (même règle que Participant.age), en SQL portable."""
+    birthday_passed = (func.extract("month", birth_col) * 100 + func.extract("day", birth_col)) <= (
+        today.month * 100 + today.day
+    )
+    return today.year - func.extract("year", birth_col) - case((birthday_passed, 0), else_=1)
+
+
+def _date_label_expr(date_col):
+    """Date au format JJ/MM/AAAA formatée par la base ("Sans date" si NULL)."""
+    if db.engine.dialect.name == "postgresql":
+        label = func.to_char(date_col, "DD/MM/YYYY")
+    else:
+        label = func.strftime("%d/%m/%Y", date_col)
+    return func.coalesce(label, "Sans date")
+
+
 def _build_magato_per_atelier_workbook(flt) -> Workbook:
     """Export annuel "Excel" : 1 feuille par atelier (matrice participants x sessions) + bloc de stats riches."""
 
@@ -412,11 +723,14 @@ def _build_magato_per_atelier_workbook(flt) -> Workbook:
         aq = aq.filter(AtelierActivite.secteur == eff_secteur)
     ateliers = aq.order_by(AtelierActivite.secteur.asc(), AtelierActivite.nom.asc()).all()
 
-    wb = Workbook()
+    # Mode write-only : les lignes sont sérialisées au fil de l'eau (mémoire stable),
+    # mais les largeurs de colonnes doivent être posées avant le premier append.
+    wb = Workbook(write_only=True)
 
     # Synthèse globale
-    ws0 = wb.active
-    ws0.title = "Synthese"
+    ws0 = wb.create_sheet("Synthese")
+    _set_col_widths(ws0, 1, 2, 20)
+    _set_col_widths(ws0, 3, 19, 18)
     ws0.append(["Export annuel : 1 feuille par atelier (matrice) + stats détaillées"])
     ws0.append([])
 
@@ -445,71 +759,172 @@ def _build_magato_per_atelier_workbook(flt) -> Workbook:
     # Agrégats globaux provenance
     global_prov = {"Bas de Creil": 0, "Hauts de Creil": 0, "Rouher": 0, "Autres": 0, "Inconnu": 0}
 
-    for at in ateliers:
-        # Sessions de l'atelier dans la période
-        sess_q = db.session.query(SessionActivite).filter(SessionActivite.atelier_id == at.id)
+    # Chargement groupé pour tous les ateliers (sessions, présences, participants) :
+    # quelques requêtes au total au lieu de 3-4 par atelier.
+    atelier_ids = [at.id for at in ateliers]
+    sessions_by_atelier: dict[int, list] = defaultdict(list)
+    pres_by_atelier: dict[int, list] = defaultdict(list)
+    date_labels_by_atelier: dict[int, list] = defaultdict(list)
+    participants_by_id: dict[int, Participant] = {}
+    participant_rank: dict[int, int] = {}
+    kpis_by_atelier: dict[int, tuple] = {}
+    age_by_atelier: dict[int, float] = {}
+    uniques_by_atelier: dict[int, int] = {}
+    # Petit référentiel : {quartier_id: nom}, lu une fois pour tout l'export
+    quartier_names = dict(db.session.query(Quartier.id, Quartier.nom).all())
+    # Catégorie de provenance calculée une fois par quartier (et non par participant)
+    bucket_by_qid = {qid: _quartier_bucket(nom) for qid, nom in quartier_names.items()}
+    if atelier_ids:
+        sess_conds = [SessionActivite.atelier_id.in_(atelier_ids)]
         if flt.date_from:
-            sess_q = sess_q.filter(func.coalesce(SessionActivite.rdv_date, SessionActivite.date_session) >= flt.date_from)
+            sess_conds.append(_session_date_expr() >= flt.date_from)
         if flt.date_to:
-            sess_q = sess_q.filter(func.coalesce(SessionActivite.rdv_date, SessionActivite.date_session) <= flt.date_to)
+            sess_conds.append(_session_date_expr() <= flt.date_to)
+
+        sess_q = db.session.query(SessionActivite).filter(*sess_conds)
+        pres_q = (
+            db.session.query(PresenceActivite.participant_id, PresenceActivite.session_id, SessionActivite.atelier_id)
+            .join(SessionActivite, PresenceActivite.session_id == SessionActivite.id)
+            .filter(*sess_conds)
+        )
+
+        # KPIs séances calculés en base : nb prévues / réelles + bornes de dates
+        # + places (capacité séance, sinon capacité par défaut de l'atelier)
+        not_cancelled = func.lower(func.coalesce(SessionActivite.statut, "")) != "annulee"
+        capacity = func.coalesce(SessionActivite.capacite, AtelierActivite.capacite_defaut, 0)
+        kpi_rows = (
+            db.session.query(
+                SessionActivite.atelier_id,
+                func.count(SessionActivite.id),
+                func.sum(case((not_cancelled, 1), else_=0)),
+                func.min(_session_date_expr()),
+                func.max(_session_date_expr()),
+                func.sum(capacity),
+                func.sum(case((not_cancelled, capacity), else_=0)),
+            )
+            .join(AtelierActivite, SessionActivite.atelier_id == AtelierActivite.id)
+            .filter(*sess_conds)
+            .group_by(SessionActivite.atelier_id)
+            .all()
+        )
+        kpis_by_atelier = {aid: tuple(rest) for aid, *rest in kpi_rows}
+
+        # Inscrits uniques + moyenne d'âge (âge révolu à aujourd'hui ; AVG ignore les
+        # dates de naissance absentes) sur les paires (atelier, participant) dédoublonnées
+        pairs = (
+            db.session.query(SessionActivite.atelier_id.label("aid"), PresenceActivite.participant_id.label("pid"))
+            .join(SessionActivite, PresenceActivite.session_id == SessionActivite.id)
+            .filter(*sess_conds)
+            .distinct()
+            .subquery()
+        )
+        age_rows = (
+            db.session.query(
+                pairs.c.aid,
+                func.count(),
+                func.avg(_age_years_expr(Participant.date_naissance, date.today())),
+            )
+            .outerjoin(Participant, Participant.id == pairs.c.pid)
+            .group_by(pairs.c.aid)
+            .all()
+        )
+        uniques_by_atelier = {aid: int(n or 0) for aid, n, _avg in age_rows}
+        age_by_atelier = {aid: float(avg) for aid, _n, avg in age_rows if avg is not None}
+
         sess_q = sess_q.order_by(
-            func.coalesce(SessionActivite.rdv_date, SessionActivite.date_session).asc(),
+            _session_date_expr().asc(),
             SessionActivite.id.asc(),
         )
-        sessions = sess_q.all()
-
-        # 1) KPIs par atelier
-        sessions_planned = len(sessions)
-        sessions_real = sum(1 for s in sessions if (s.statut or "").lower() != "annulee")
-        dates = [d for d in [(s.rdv_date or s.date_session) for s in sessions] if d]
-        duration_days = (max(dates) - min(dates)).days if dates else None
-
-        # heures + capacités
-        planned_hours = 0.0
-        real_hours = 0.0
-        planned_capacity = 0
-        real_capacity = 0
+        sess_q = sess_q.add_columns(_date_label_expr(_session_date_expr()).label("date_label"))
+        for s, date_label in sess_q.all():
+            sessions_by_atelier[s.atelier_id].append(s)
+            date_labels_by_atelier[s.atelier_id].append(date_label)
+        for pid, sid, aid in pres_q.all():
+            pres_by_atelier[aid].append((pid, sid))
+
+        all_pids = {int(pid) for rows in pres_by_atelier.values() for (pid, _sid) in rows if pid is not None}
+        if all_pids:
+            # Tri global nom/prénom (participant_rank) : chaque feuille reprend cet ordre.
+            # Seules les colonnes utiles sont chargées ; le quartier vient de quartier_names.
+            participants_by_id = {
+                int(p.id): p
+                for p in (
+                    db.session.query(Participant)
+                    .options(
+                        load_only(
+                            Participant.id,
+                            Participant.nom,
+                            Participant.prenom,
+                            Participant.ville,
+                            Participant.date_naissance,
+                            Participant.quartier_id,
+                        )
+                    )
+                    .filter(Participant.id.in_(all_pids))
+                    .order_by(Participant.nom.asc(), Participant.prenom.asc(), Participant.id.asc())
+                    .all()
+                )
+            }
+            participant_rank = {pid: rank for rank, pid in enumerate(participants_by_id)}
+
+    for at in ateliers:
+        # Sessions / présences de l'atelier dans la période. pop() : une fois la feuille
+        # écrite (write-only), plus rien ne les référence et la mémoire est rendue
+        # atelier par atelier au lieu de s'accumuler jusqu'à la fin de l'export.
+        sessions = sessions_by_atelier.pop(at.id, [])
+        date_labels = date_labels_by_atelier.pop(at.id, [])
+        pres_rows = pres_by_atelier.pop(at.id, [])
+
+        # 1) KPIs par atelier (agrégés en base)
+        (
+            sessions_planned,
+            sessions_real,
+            date_min,
+            date_max,
+            planned_capacity,
+            real_capacity,
+        ) = kpis_by_atelier.get(at.id, (0, 0, None, None, 0, 0))
+        sessions_planned = int(sessions_planned or 0)
+        sessions_real = int(sessions_real or 0)
+        planned_capacity = int(planned_capacity or 0)
+        real_capacity = int(real_capacity or 0)
+        duration_days = (date_max - date_min).days if (date_min and date_max) else None
+
+        # heures : les horaires sont du texte libre ("14h", "9:00"), parsés côté Python
+        # (parse mémoïsé) ; on somme des minutes entières puis on convertit une fois.
+        planned_minutes = 0
+        real_minutes = 0
         for s in sessions:
             mins = _session_duration_minutes(s, at) or 0
-            h = float(mins) / 60.0 if mins else 0.0
-            planned_hours += h
-            cap = s.capacite if s.capacite is not None else (getattr(at, "capacite_defaut", 0) or 0)
-            planned_capacity += int(cap or 0)
+            planned_minutes += mins
             if (s.statut or "").lower() != "annulee":
-                real_hours += h
-                real_capacity += int(cap or 0)
+                real_minutes += mins
+        planned_hours = planned_minutes / 60.0
+        real_hours = real_minutes / 60.0
 
         if sessions_planned == 0:
             # atelier sans session dans le filtre -> ligne 0 + pas de feuille matrice
             ws0.append([at.secteur, at.nom, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, "", "", 0, 0, 0, 0, 0])
             continue
 
-        session_ids = [s.id for s in sessions]
-
-        pres_rows = db.session.query(PresenceActivite.participant_id, PresenceActivite.session_id)             .filter(PresenceActivite.session_id.in_(session_ids)).all()
-
+        # Les paires (participant, session) sont chargées pour la matrice : leur nombre
+        # est le nombre de présences, sans requête de comptage supplémentaire.
         presences_total = len(pres_rows)
-        pid_set = sorted({int(pid) for (pid, _sid) in pres_rows if pid is not None})
-        inscrits_uniques = len(pid_set)
-
-        # participants (objets) pour âge + provenance
-        participants = []
-        if pid_set:
-            participants = (
-                db.session.query(Participant)
-                .options(joinedload(Participant.quartier))
-                .filter(Participant.id.in_(pid_set))
-                .all()
-            )
+        inscrits_uniques = uniques_by_atelier.get(at.id, 0)
+        pid_set = {int(pid) for (pid, _sid) in pres_rows if pid is not None}
+
+        # Participants de l'atelier (chargés une seule fois pour tout l'export), remis
+        # dans l'ordre nom/prénom de la requête globale : servent à la provenance et à la matrice.
+        participants = sorted(
+            (participants_by_id[pid] for pid in pid_set if pid in participants_by_id),
+            key=lambda p: participant_rank[p.id],
+        )
 
-        ages = [p.age for p in participants if getattr(p, "age", None) is not None]
-        age_avg = round(sum(ages) / len(ages), 1) if ages else None
+        age_avg = round(age_by_atelier[at.id], 1) if at.id in age_by_atelier else None
 
         prov = {"Bas de Creil": 0, "Hauts de Creil": 0, "Rouher": 0, "Autres": 0, "Inconnu": 0}
         for p in participants:
-            qname = p.quartier.nom if getattr(p, "quartier", None) is not None else None
-            b = _quartier_bucket(qname)
-            prov[b] = prov.get(b, 0) + 1
+            prov[bucket_by_qid.get(p.quartier_id, "Inconnu")] += 1
         for k in global_prov:
             global_prov[k] += prov.get(k, 0)
 
@@ -540,6 +955,10 @@ def _build_magato_per_atelier_workbook(flt) -> Workbook:
 
         # 2) Feuille atelier : bloc stats + matrice
         ws = wb.create_sheet(_safe_sheet_title(f"{at.nom}"))
+        # Largeurs (avant toute ligne, cf. write-only) : identification + 1 colonne par séance
+        for letter, width in zip(COL_LETTERS, (20, 18, 8, 18, 22)):
+            ws.column_dimensions[letter].width = width
+        _set_col_widths(ws, 6, len(sessions) + 5, 12)
 
         ws.append([f"{at.secteur} — {at.nom}"])
         ws.append([])
@@ -570,59 +989,30 @@ def _build_magato_per_atelier_workbook(flt) -> Workbook:
 
         # Matrice participants × sessions
         # (A) Antoine wanted a quick visual identification: âge + ville + quartier à côté du nom/prénom.
-        headers = ["Nom", "Prénom", "Âge", "Ville", "Quartier"] + [
-            ((d.strftime("%d/%m/%Y")) if (d := (s.rdv_date or s.date_session)) else "Sans date")
-            for s in sessions
-        ]
+        headers = ["Nom", "Prénom", "Âge", "Ville", "Quartier", *date_labels]
         ws.append(headers)
 
         if not pres_rows or not pid_set:
             # matrice vide structurée
-            ws.column_dimensions[get_column_letter(1)].width = 20
-            ws.column_dimensions[get_column_letter(2)].width = 18
-            ws.column_dimensions[get_column_letter(3)].width = 8
-            ws.column_dimensions[get_column_letter(4)].width = 18
-            ws.column_dimensions[get_column_letter(5)].width = 22
-            for col_idx in range(6, len(headers) + 1):
-                ws.column_dimensions[get_column_letter(col_idx)].width = 12
             continue
 
-        # Participants (objets) pour trier + infos d'identification (âge/ville/quartier)
-        parts = (
-            db.session.query(Participant)
-            .options(joinedload(Participant.quartier))
-            .filter(Participant.id.in_(pid_set))
-            .order_by(Participant.nom.asc(), Participant.prenom.asc())
-            .all()
-        )
-
         sid_index = {int(s.id): idx for idx, s in enumerate(sessions)}
-        present = {(int(pid), int(sid)) for (pid, sid) in pres_rows if pid is not None and sid is not None}
-
-        for p in parts:
-            pid = int(p.id)
-            nom = p.nom or ""
-            prenom = p.prenom or ""
-            age = getattr(p, "age", None)
-            age = age if age is not None else ""
-            ville = p.ville or ""
-            quartier = p.quartier.nom if getattr(p, "quartier", None) is not None else ""
-
-            row = [nom, prenom, age, ville, quartier] + [""] * len(sessions)
-            for sid, idx in sid_index.items():
-                if (int(pid), int(sid)) in present:
-                    row[5 + idx] = "1"
+        # {pid: {index de colonne}} : on ne touche que les présences réelles (matrice creuse)
+        present_by_pid: dict[int, set[int]] = defaultdict(set)
+        for pid, sid in pres_rows:
+            if pid is not None and sid is not None:
+                present_by_pid[int(pid)].add(sid_index[int(sid)])
+
+        # Cellules vides = None : openpyxl (write-only) n'écrit alors aucune balise <c>,
+        # seules les présences produisent une cellule.
+        empty_sessions = [None] * len(sessions)
+        for p in participants:
+            row = [p.nom or None, p.prenom or None, p.age, p.ville or None, quartier_names.get(p.quartier_id) or None]
+            row += empty_sessions
+            for idx in present_by_pid.get(int(p.id), ()):
+                row[5 + idx] = "1"
             ws.append(row)
 
-        # Largeurs
-        ws.column_dimensions[get_column_letter(1)].width = 20
-        ws.column_dimensions[get_column_letter(2)].width = 18
-        ws.column_dimensions[get_column_letter(3)].width = 8
-        ws.column_dimensions[get_column_letter(4)].width = 18
-        ws.column_dimensions[get_column_letter(5)].width = 22
-        for col_idx in range(6, len(headers) + 1):
-            ws.column_dimensions[get_column_letter(col_idx)].width = 12
-
     # Bloc "Provenance globale" en bas de la synthèse
     ws0.append([])
     ws0.append(["Provenance globale (inscrits uniques sur l'ensemble du périmètre)"])
@@ -632,10 +1022,6 @@ def _build_magato_per_atelier_workbook(flt) -> Workbook:
     ws0.append(["Autres", global_prov.get("Autres", 0)])
     ws0.append(["Inconnu", global_prov.get("Inconnu", 0)])
 
-    # Largeurs synthèse
-    for col in range(1, 20):
-        ws0.column_dimensions[get_column_letter(col)].width = 20 if col <= 2 else 18
-
     return wb
 
 
@@ -656,17 +1042,7 @@ def exports():
 
     secteurs = []
     if can("statsimpact:view_all") or can("scope:all_secteurs"):
-        secteurs = [
-            s[0]
-            for s in (
-                AtelierActivite.query.with_entities(AtelierActivite.secteur)
-                .filter(AtelierActivite.is_deleted.is_(False))
-                .distinct()
-                .order_by(AtelierActivite.secteur.asc())
-                .all()
-            )
-            if s and s[0]
-        ]
+        secteurs = _active_secteurs()
 
     q = AtelierActivite.query.filter(AtelierActivite.is_deleted.is_(False))
     if flt.secteur:
@@ -691,6 +1067,59 @@ def exports_slash():
     return redirect(url_for("statsimpact.exports", **request.args.to_dict(flat=True)))
 
 
+# Calculs nécessaires à chaque onglet du dashboard : seuls ceux de l'onglet
+# affiché sont exécutés, les autres onglets rechargent la page à l'ouverture.
+DASHBOARD_TAB_DEPS = {
+    "base": ("stats",),
+    "advanced": ("stats", "freq", "trans", "demo", "occupancy"),
+    "participants": ("participants", "quartiers"),
+    "magato": ("magato",),
+}
+DASHBOARD_TAB_ALIASES = {"magatomatique": "magato"}
+
+# Calculs indépendants du dashboard (une série de requêtes SQL chacun).
+# Plusieurs calculs pour un onglet : exécutés en parallèle, pool partagé
+# borné (connexions simultanées limitées quel que soit le nombre de requêtes ;
+# pris en compte dans SQLALCHEMY_ENGINE_OPTIONS, cf. config.py).
+DASHBOARD_COMPUTES = {
+    "participants": compute_participants_stats,
+    "stats": compute_volume_activity_stats,
+    "freq": compute_participation_frequency_stats,
+    "trans": compute_transversalite_stats,
+    "demo": compute_demography_stats,
+    "occupancy": compute_occupancy_stats,
+}
+DASHBOARD_WORKERS = 4
+_dashboard_pool = ThreadPoolExecutor(max_workers=DASHBOARD_WORKERS, thread_name_prefix="statsimpact")
+
+
+def _run_dashboard_computes(names, flt) -> dict:
+    """
+    Exécute les calculs demandés. Le premier tourne sur le thread de la requête,
+    les autres dans le pool : chacun dans une copie du contexte de requête
+    (même utilisateur => même périmètre secteur), donc avec sa propre session SQLAlchemy.
+    """
+    names = [n for n in DASHBOARD_COMPUTES if n in names]
+    if not names:
+        return {}
+
+    def _task(fn):
+        @copy_current_request_context
+        def run():
+            return fn(flt)
+
+        return run
+
+    futures = {n: _dashboard_pool.submit(_task(DASHBOARD_COMPUTES[n])) for n in names[1:]}
+    try:
+        results = {names[0]: DASHBOARD_COMPUTES[names[0]](flt)}
+        for n, fut in futures.items():
+            results[n] = fut.result()
+    finally:
+        # Aucun calcul ne doit survivre à la requête (contexte copié), même en cas d'erreur
+        wait(futures.values())
+    return results
+
 
 @bp.route("/stats-impact/dashboard", methods=["GET", "POST"])
 @login_required
@@ -710,10 +1139,9 @@ def dashboard():
         flt.date_from = date(today.year, 1, 1)
         flt.date_to = date(today.year, 12, 31)
 
-    # Pre-compute participants for access control if we need to handle edits.
-    participants = compute_participants_stats(flt)
-
     if request.method == "POST":
+        # Toutes les issues du POST reviennent sur l'onglet participants, filtres conservés
+        participants_url = url_for("statsimpact.dashboard", **{**args, "tab": "participants"})
         action = request.form.get("action")
         if action == "update_participant":
             try:
@@ -721,8 +1149,8 @@ def dashboard():
             except Exception:
                 participant_id = 0
 
-            allowed_ids = {p["id"] for p in participants.get("participants", [])}
-            if not participant_id or participant_id not in allowed_ids:
+            # Contrôle d'accès : le participant doit être visible dans le périmètre filtré
+            if not participant_id or not participant_in_scope(flt, participant_id):
                 abort(403)
 
             participant = Participant.query.get(participant_id)
@@ -750,17 +1178,13 @@ def dashboard():
             participant.quartier_id = normalize_quartier_for_ville(participant.ville, quartier_id)
 
             try:
-                from app.extensions import db
-
                 db.session.commit()
                 flash("Participant mis à jour.", "success")
             except Exception:
                 db.session.rollback()
                 flash("Impossible de sauvegarder ce participant.", "danger")
 
-            args_redirect = request.args.to_dict(flat=True)
-            args_redirect["tab"] = "participants"
-            return redirect(url_for("statsimpact.dashboard", **args_redirect))
+            return redirect(participants_url)
 
         if action == "delete_participant":
             try:
@@ -768,8 +1192,8 @@ def dashboard():
             except Exception:
                 participant_id = 0
 
-            allowed_ids = {p["id"] for p in participants.get("participants", [])}
-            if not participant_id or participant_id not in allowed_ids:
+            # Contrôle d'accès : le participant doit être visible dans le périmètre filtré
+            if not participant_id or not participant_in_scope(flt, participant_id):
                 abort(403)
 
             participant = Participant.query.get(participant_id)
@@ -780,61 +1204,78 @@ def dashboard():
             # que si ce participant n'a des présences que dans SON secteur (ou aucune).
             user_secteur = (getattr(current_user, "secteur_assigne", None) or "").strip()
             if not can("participants:view_all"):
-                sectors = (
-                    PresenceActivite.query.join(SessionActivite, PresenceActivite.session_id == SessionActivite.id)
-                    .with_entities(SessionActivite.secteur)
-                    .filter(PresenceActivite.participant_id == participant_id)
-                    .distinct()
-                    .all()
+                # Nb d'émargements dans un AUTRE secteur (renseigné) que celui de l'utilisateur ;
+                # s'il n'a jamais émargé : OK
+                foreign_presences = (
+                    db.session.query(func.count(PresenceActivite.id))
+                    .join(SessionActivite, PresenceActivite.session_id == SessionActivite.id)
+                    .filter(
+                        PresenceActivite.participant_id == participant_id,
+                        SessionActivite.secteur != "",
+                        SessionActivite.secteur != user_secteur,
+                    )
+                    .scalar()
                 )
-                sectors = {s[0] for s in sectors if s and s[0]}
-                # s'il n'a jamais émargé: OK (secteurs = vide)
-                if sectors and sectors != {user_secteur}:
+                if foreign_presences:
                     flash(
                         "Suppression refusée : ce participant a des émargements dans d'autres secteurs.",
                         "danger",
                     )
-                    args_redirect = request.args.to_dict(flat=True)
-                    args_redirect["tab"] = "participants"
-                    return redirect(url_for("statsimpact.dashboard", **args_redirect))
+                    return redirect(participants_url)
 
             try:
-                from app.extensions import db
-
-                # Supprime d'abord les signatures des présences
-                presences = PresenceActivite.query.filter_by(participant_id=participant_id).all()
-                for pr in presences:
-                    if pr.signature_path:
-                        try:
-                            if os.path.exists(pr.signature_path):
-                                os.remove(pr.signature_path)
-                        except Exception:
-                            pass
-                    db.session.delete(pr)
+                # Signatures à effacer, puis suppression des présences en un seul DELETE
+                signature_paths = {
+                    path
+                    for (path,) in db.session.query(PresenceActivite.signature_path).filter(
+                        PresenceActivite.participant_id == participant_id,
+                        PresenceActivite.signature_path.isnot(None),
+                    )
+                    if path
+                }
+                db.session.execute(
+                    PresenceActivite.__table__.delete().where(PresenceActivite.participant_id == participant_id)
+                )
 
                 db.session.delete(participant)
                 db.session.commit()
+
+                # Fichiers supprimés une fois le commit acquis (jamais de signature orpheline en base)
+                # (un seul unlink par fichier : absent = déjà supprimé)
+                for path in signature_paths:
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
+                    except OSError:
+                        current_app.logger.warning("Signature non supprimée : %s", path)
                 flash("Participant supprimé définitivement.", "success")
             except Exception:
                 db.session.rollback()
                 flash("Impossible de supprimer ce participant.", "danger")
 
-            args_redirect = request.args.to_dict(flat=True)
-            args_redirect["tab"] = "participants"
-            return redirect(url_for("statsimpact.dashboard", **args_redirect))
+            return redirect(participants_url)
 
-    # Refresh computed stats after any potential mutation
-    participants = compute_participants_stats(flt)
-    stats = compute_volume_activity_stats(flt)
-    freq = compute_participation_frequency_stats(flt)
-    trans = compute_transversalite_stats(flt)
-    demo = compute_demography_stats(flt)
-    occupancy = compute_occupancy_stats(flt)
+    # Onglet affiché : on ne calcule que ce dont il a besoin.
+    # Un onglet inconnu (anciens liens) garde l'ancien comportement : tout sauf le Magatomatique.
+    tab = (request.args.get("tab") or "base").strip().lower()
+    tab = DASHBOARD_TAB_ALIASES.get(tab, tab)
+    if tab in DASHBOARD_TAB_DEPS:
+        needed = set(DASHBOARD_TAB_DEPS[tab])
+    else:
+        needed = {dep for key, deps in DASHBOARD_TAB_DEPS.items() if key != "magato" for dep in deps}
+
+    computed = _run_dashboard_computes(needed, flt)
+    participants = computed.get("participants")
+    stats = computed.get("stats")
+    freq = computed.get("freq")
+    trans = computed.get("trans")
+    demo = computed.get("demo")
+    occupancy = computed.get("occupancy")
 
     # Le Magatomatique : calcul uniquement si l'onglet est affiché (sinon on garde la page légère)
-    tab = (request.args.get("tab") or "base").strip().lower()
     magato = None
-    if tab in ("magato", "magatomatique"):
+    if "magato" in needed:
         participant_q = (request.args.get("participant_q") or "").strip() or None
         view = (request.args.get("magato_view") or "macro").strip().lower()
         try:
@@ -858,45 +1299,25 @@ def dashboard():
             max_participants=max_participants,
         )
 
-    participants = compute_participants_stats(flt)
-
     secteurs = []
     if can("statsimpact:view_all") or can("scope:all_secteurs"):
-        secteurs = [
-            s[0]
-            for s in (
-                AtelierActivite.query.with_entities(AtelierActivite.secteur)
-                .filter(AtelierActivite.is_deleted.is_(False))
-                .distinct()
-                .order_by(AtelierActivite.secteur.asc())
-                .all()
-            )
-            if s and s[0]
-        ]
+        secteurs = _active_secteurs()
 
     q = AtelierActivite.query.filter(AtelierActivite.is_deleted.is_(False))
     if flt.secteur:
         q = q.filter(AtelierActivite.secteur == flt.secteur)
     ateliers = q.order_by(AtelierActivite.secteur.asc(), AtelierActivite.nom.asc()).all()
 
-    quartiers = Quartier.query.order_by(Quartier.ville.asc(), Quartier.nom.asc()).all()
+    quartiers = []
+    if "quartiers" in needed:
+        quartiers = Quartier.query.order_by(Quartier.ville.asc(), Quartier.nom.asc()).all()
 
     # Années disponibles (pour presets "année") dans le périmètre accessible
     try:
         eff_secteur = flt.secteur
         if not can("scope:all_secteurs"):
             eff_secteur = (getattr(current_user, "secteur_assigne", None) or "").strip() or eff_secteur
-
-        year_expr = func.extract("year", func.coalesce(SessionActivite.rdv_date, SessionActivite.date_session))
-        years_q = (
-            db.session.query(year_expr.label("y"))
-            .select_from(SessionActivite)
-            .join(AtelierActivite, SessionActivite.atelier_id == AtelierActivite.id)
-            .filter(AtelierActivite.is_deleted.is_(False))
-        )
-        if eff_secteur:
-            years_q = years_q.filter(AtelierActivite.secteur == eff_secteur)
-        years = [int(r.y) for r in years_q.distinct().order_by(year_expr.desc()).all() if r and r.y]
+        years = _available_years(eff_secteur)
     except Exception:
         years = []
 
@@ -938,23 +1359,42 @@ def magatomatique_export_csv():
 
     query = _query_presence_export(flt, participant_q=participant_q)
 
-    output = StringIO()
-    writer = csv.writer(output, delimiter=";")
-    writer.writerow([CSV_FIELD_MAP[f]["label"] for f in fields])
-
-    for presence, participant, session, atelier, quartier in query.all():
-        ctx = {
-            "presence": presence,
-            "participant": participant,
-            "session": session,
-            "atelier": atelier,
-            "quartier": quartier,
-        }
-        writer.writerow([CSV_FIELD_MAP[f]["getter"](ctx) for f in fields])
+    build_row = _compile_csv_row(tuple(fields))
+
+    def generate():
+        # Réponse en flux : le tampon ne contient jamais plus d'un lot de lignes
+        buf = StringIO()
+        writer = csv.writer(buf, delimiter=";")
+        writer.writerow([CSV_FIELD_MAP[f]["label"] for f in fields])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate(0)
+
+        # Écriture par lots (writerows) : un appel C par bloc de lignes au lieu d'un par ligne
+        batch = []
+        # Lecture par paquets (curseur serveur sur Postgres) : mémoire bornée quel que soit le volume
+        rows = query.execution_options(stream_results=True).yield_per(2000)
+        for presence, participant, session, atelier, quartier in rows:
+            batch.append(build_row(presence, participant, session, atelier, quartier))
+            if len(batch) >= CSV_WRITE_BATCH:
+                writer.writerows(batch)
+                batch.clear()
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate(0)
+        if batch:
+            writer.writerows(batch)
+            yield buf.getvalue()
 
     csv_name = "magatomatique_export.csv"
-    resp = Response(output.getvalue(), mimetype="text/csv")
+    if _accepts_gzip():
+        resp = Response(stream_with_context(_gzip_stream(generate())), mimetype="text/csv")
+        resp.headers["Content-Encoding"] = "gzip"
+    else:
+        resp = Response(stream_with_context(generate()), mimetype="text/csv")
+    resp.vary.add("Accept-Encoding")
     resp.headers["Content-Disposition"] = f"attachment; filename={csv_name}"
+    resp.headers["Cache-Control"] = EXPORT_CACHE_CONTROL
     return resp
 
 
@@ -985,17 +1425,7 @@ def magatomatique_export():
     # Mode "per_atelier" : export annuel 1 feuille = 1 atelier
     if export_mode in ("per_atelier", "per-atelier", "atelier"):
         wb = _build_magato_per_atelier_workbook(flt)
-        bio = BytesIO()
-        wb.save(bio)
-        bio.seek(0)
-
-        filename = "magatomatique_par_atelier.xlsx"
-        return send_file(
-            bio,
-            as_attachment=True,
-            download_name=filename,
-            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        )
+        return _xlsx_response(wb, "magatomatique_par_atelier.xlsx")
 
     magato = compute_magatomatique(
         flt,
@@ -1008,9 +1438,9 @@ def magatomatique_export():
     if magato.get("restricted"):
         abort(403)
 
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Synthese"
+    # Write-only : lignes sérialisées au fil de l'eau (largeurs posées avant le premier append)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Synthese")
 
     # En-têtes synthèse macro (secteurs)
     ws.append(["Synthèse par secteur"])
@@ -1048,51 +1478,44 @@ def magatomatique_export():
         sessions = magato["sessions"]
         participants = magato["participants"]
         matrix = magato.get("matrix") or {}
+        session_ids = [int(s["id"]) for s in sessions]
+        session_index = {sid: idx for idx, sid in enumerate(session_ids)}
+
+        # {pid: {sid}} construit une fois : plus de tuple (pid, sid) ni de hash par cellule
+        sids_by_pid: dict[int, set[int]] = {}
+        for (m_pid, m_sid), present in matrix.items():
+            if present:
+                sids_by_pid.setdefault(int(m_pid), set()).add(int(m_sid))
 
         header = ["Nom", "Prénom"] + [f'{s["atelier"]} · {s["label"]}' for s in sessions]
+        # Ajuste largeur colonnes
+        _set_col_widths(ws3, 1, 2, 16)
+        _set_col_widths(ws3, 3, len(header), 12)
         ws3.append(header)
 
         for p in participants:
+            sids = sids_by_pid.get(int(p["id"]), ())
             row = [p.get("nom",""), p.get("prenom","")]
-            pid = int(p["id"])
-            for s in sessions:
-                sid = int(s["id"])
-                row.append("1" if matrix.get((pid, sid)) else "")
+            row.extend("1" if sid in sids else "" for sid in session_ids)
             ws3.append(row)
 
-        # Ajuste largeur colonnes
-        for col_idx in range(1, len(header) + 1):
-            ws3.column_dimensions[get_column_letter(col_idx)].width = 16 if col_idx <= 2 else 12
-
         ws4 = wb.create_sheet("Participations")
+        _set_col_widths(ws4, 1, 6, 18)
         ws4.append(["Nom", "Prénom", "Atelier", "Secteur", "Date session", "ID session"])
         for p in participants:
-            pid = int(p["id"])
-            for s in sessions:
-                sid = int(s["id"])
-                if matrix.get((pid, sid)):
-                    ws4.append(
-                        [
-                            p.get("nom", ""),
-                            p.get("prenom", ""),
-                            s.get("atelier", ""),
-                            s.get("secteur", ""),
-                            s.get("date").strftime("%Y-%m-%d") if s.get("date") else "",
-                            sid,
-                        ]
-                    )
-
-        for col_idx in range(1, 7):
-            ws4.column_dimensions[get_column_letter(col_idx)].width = 18
-
-    bio = BytesIO()
-    wb.save(bio)
-    bio.seek(0)
+            sids = sids_by_pid.get(int(p["id"]), ())
+            # Seulement les présences réelles, dans l'ordre chronologique des colonnes
+            for idx in sorted(session_index[sid] for sid in sids if sid in session_index):
+                s = sessions[idx]
+                ws4.append(
+                    [
+                        p.get("nom", ""),
+                        p.get("prenom", ""),
+                        s.get("atelier", ""),
+                        s.get("secteur", ""),
+                        s.get("date").strftime("%Y-%m-%d") if s.get("date") else "",
+                        session_ids[idx],
+                    ]
+                )
 
-    filename = "magatomatique.xlsx"
-    return send_file(
-        bio,
-        as_attachment=True,
-        download_name=filename,
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-    )
+    return _xlsx_response(wb, "magatomatique.xlsx")
@@ -42,6 +42,19 @@ class Config:
 
     SQLALCHEMY_DATABASE_URI = _db_url
 
+    # Pool de connexions : une par thread waitress (ERP_THREADS, cf. run_waitress.py)
+    # + les calculs parallèles du dashboard Stats & Impacts (DASHBOARD_WORKERS = 4)
+    # + le rafraîchissement de la vue d'occupation. SQLite en mémoire : pool unique.
+    if ":memory:" not in _db_url and _db_url != "sqlite://":
+        SQLALCHEMY_ENGINE_OPTIONS = {
+            "pool_size": int(os.environ.get("ERP_THREADS", "12")) + 4 + 1,
+            "max_overflow": 5,
+        }
+
+    # Stats & Impacts (Postgres) : rafraîchissement de la vue d'occupation en
+    # tâche de fond, toutes les N secondes (0 = désactivé)
+    OCCUPANCY_REFRESH_SECONDS = int(os.environ.get("OCCUPANCY_REFRESH_SECONDS", "300"))
+
     # --- Domaines / constantes ----------------------------------------------
     SECTEURS = [
         "Numérique",
@@ -1,5 +1,8 @@
+import io
+import json
 import os
-from sqlalchemy import create_engine, MetaData, Table, inspect
+from datetime import date, datetime, time
+from sqlalchemy import create_engine, MetaData, Table
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -23,8 +26,9 @@ sqlite_meta.reflect(bind=sqlite_engine)
 sqlite_tables = set(sqlite_meta.tables.keys())
 print(f"📦 {len(sqlite_tables)} tables trouvées (SQLite)")
 
-pg_insp = inspect(pg_engine)
-pg_tables = set(pg_insp.get_table_names(schema="public"))
+# Schéma Postgres réfléchi une seule fois (insert_rows n'interroge plus le catalogue)
+pg_meta.reflect(bind=pg_engine, schema="public")
+pg_tables = {t.name for t in pg_meta.tables.values()}
 print(f"🧱 {len(pg_tables)} tables trouvées (Postgres/public)")
 
 if len(pg_tables) == 0:
@@ -101,17 +105,89 @@ ordered_tables.extend(remaining)
 print("🧭 Ordre de migration:")
 print("   " + " -> ".join(ordered_tables))
 
-def fetch_rows(sqlite_conn, table: Table):
-    res = sqlite_conn.execute(table.select())
-    return res.mappings().all()
+# Lignes lues par paquet côté SQLite (jamais une table entière en mémoire)
+FETCH_CHUNK = 5000
 
-def insert_rows(pg_conn, table_name: str, rows):
-    if not rows:
+
+def iter_rows(sqlite_conn, table: Table, chunk: int = FETCH_CHUNK):
+    """Paquets de lignes (mappings) de la table SQLite, lus au fil de l'eau."""
+    res = sqlite_conn.execution_options(stream_results=True).execute(table.select())
+    yield from res.mappings().partitions(chunk)
+
+# Taille des paquets envoyés via COPY (mémoire bornée côté Python)
+COPY_CHUNK = 10000
+
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def _copy_value(value) -> str:
+    """Valeur Python -> champ du format texte de COPY (\\N = NULL)."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return "\\\\x" + bytes(value).hex()
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, ensure_ascii=False)
+    return str(value).translate(_COPY_ESCAPES)
+
+
+def copy_rows(pg_conn, pg_table: Table, columns: list[str], rows) -> int:
+    """COPY FROM STDIN par paquets de COPY_CHUNK lignes, dans la transaction de pg_conn."""
+    preparer = pg_conn.dialect.identifier_preparer
+    sql = "COPY {} ({}) FROM STDIN".format(
+        preparer.format_table(pg_table),
+        ", ".join(preparer.quote(c) for c in columns),
+    )
+    cursor = pg_conn.connection.dbapi_connection.cursor()
+    count = 0
+    try:
+        buf = io.StringIO()
+        pending = 0
+        for r in rows:
+            buf.write("\t".join(_copy_value(r[c]) for c in columns))
+            buf.write("\n")
+            pending += 1
+            if pending >= COPY_CHUNK:
+                _copy_buffer(cursor, sql, buf)
+                count += pending
+                buf = io.StringIO()
+                pending = 0
+        if pending:
+            _copy_buffer(cursor, sql, buf)
+            count += pending
+    finally:
+        cursor.close()
+    return count
+
+
+def _copy_buffer(cursor, sql: str, buf: io.StringIO) -> None:
+    buf.seek(0)
+    if hasattr(cursor, "copy_expert"):  # psycopg2
+        cursor.copy_expert(sql, buf)
+    else:  # psycopg (3)
+        with cursor.copy(sql) as copy:
+            copy.write(buf.getvalue())
+
+
+def insert_rows(pg_conn, table_name: str, batches, source_columns):
+    pg_table = pg_meta.tables[f"public.{table_name}"]
+    # Colonnes générées (ex: session_activite.session_effective_date) : calculées par Postgres
+    columns = [c.name for c in pg_table.columns if c.computed is None and c.name in source_columns]
+    if pg_conn.dialect.name == "postgresql":
+        count = copy_rows(pg_conn, pg_table, columns, (r for batch in batches for r in batch))
+    else:
+        count = 0
+        for batch in batches:
+            pg_conn.execute(pg_table.insert(), [{c: r[c] for c in columns} for r in batch])
+            count += len(batch)
+    if not count:
         print("   (vide)")
         return
-    pg_table = Table(table_name, pg_meta, schema="public", autoload_with=pg_engine)
-    pg_conn.execute(pg_table.insert(), rows)
-    print(f"   ✅ {len(rows)} ligne(s)")
+    print(f"   ✅ {count} ligne(s)")
 
 with sqlite_engine.connect() as sqlite_conn, pg_engine.connect() as pg_conn:
     trans = pg_conn.begin()
@@ -119,8 +195,8 @@ with sqlite_engine.connect() as sqlite_conn, pg_engine.connect() as pg_conn:
         for tname in ordered_tables:
             print(f"➡️ Migration table : {tname}")
             sqlite_table = sqlite_meta.tables[tname]
-            rows = fetch_rows(sqlite_conn, sqlite_table)
-            insert_rows(pg_conn, tname, rows)
+            batches = iter_rows(sqlite_conn, sqlite_table)
+            insert_rows(pg_conn, tname, batches, set(sqlite_table.columns.keys()))
 
         trans.commit()
         print("✅ Migration terminée avec succès.")
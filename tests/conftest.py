@@ -0,0 +1,36 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Base SQLite jetable : config.py lit l'environnement à l'import
+_TMP_DIR = tempfile.mkdtemp(prefix="appgestion-tests-")
+os.environ["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + os.path.join(_TMP_DIR, "test.db").replace("\\", "/")
+os.environ["APP_DATA_DIR"] = os.path.join(_TMP_DIR, "data")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app  # noqa: E402
+from app.extensions import db  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def login(client, user_id: int) -> None:
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(user_id)
+        sess["_fresh"] = True
@@ -0,0 +1,108 @@
+import threading
+import time
+from datetime import date
+
+import pytest
+
+from app.extensions import db
+from app.models import (
+    AtelierActivite,
+    Participant,
+    Permission,
+    PresenceActivite,
+    Role,
+    SessionActivite,
+    User,
+)
+
+from app.statsimpact import routes as statsimpact_routes
+
+from .conftest import login
+
+DASHBOARD_URL = "/stats-impact/dashboard?date_from=2026-01-01&date_to=2026-12-31&tab=participants"
+
+
+def _sector_user(secteur: str) -> int:
+    """Utilisateur sectorisé : stats + suppression, sans participants:view_all."""
+    role = Role(code="test_secteur", label="Test secteur")
+    db.session.add(role)
+    for code in ("statsimpact:view", "participants:delete"):
+        perm = Permission.query.filter_by(code=code).first() or Permission(code=code)
+        role.permissions.append(perm)
+    user = User(email="secteur@test", nom="Secteur", role="test_secteur", secteur_assigne=secteur)
+    user.set_password("pw")
+    user.roles.append(role)
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+
+def _participant_with_presences(*secteurs: str) -> int:
+    participant = Participant(nom="Dupont", prenom="Alex")
+    db.session.add(participant)
+    for i, secteur in enumerate(secteurs):
+        atelier = AtelierActivite(secteur=secteur, nom=f"Atelier {i}", type_atelier="COLLECTIF")
+        db.session.add(atelier)
+        db.session.flush()
+        session = SessionActivite(
+            atelier_id=atelier.id,
+            secteur=secteur,
+            session_type="COLLECTIF",
+            date_session=date(2026, 3, 1 + i),
+        )
+        db.session.add(session)
+        db.session.flush()
+        db.session.add(PresenceActivite(session_id=session.id, participant_id=participant.id))
+    db.session.commit()
+    return participant.id
+
+
+def test_sector_user_deletes_participant_of_own_sector(app, client):
+    with app.app_context():
+        user_id = _sector_user("Numérique")
+        participant_id = _participant_with_presences("Numérique")
+    login(client, user_id)
+
+    resp = client.post(DASHBOARD_URL, data={"action": "delete_participant", "participant_id": str(participant_id)})
+
+    assert resp.status_code == 302
+    with app.app_context():
+        assert db.session.get(Participant, participant_id) is None
+        assert PresenceActivite.query.filter_by(participant_id=participant_id).count() == 0
+
+
+def test_sector_user_cannot_delete_participant_seen_in_other_sector(app, client):
+    with app.app_context():
+        user_id = _sector_user("Numérique")
+        participant_id = _participant_with_presences("Numérique", "Familles")
+    login(client, user_id)
+
+    resp = client.post(DASHBOARD_URL, data={"action": "delete_participant", "participant_id": str(participant_id)})
+
+    assert resp.status_code == 302
+    with app.app_context():
+        assert db.session.get(Participant, participant_id) is not None
+        assert PresenceActivite.query.filter_by(participant_id=participant_id).count() == 2
+
+
+def test_dashboard_computes_wait_for_workers_when_one_fails(app, monkeypatch):
+    finished = threading.Event()
+
+    def _fail(flt):
+        raise RuntimeError("boom")
+
+    def _slow(flt):
+        time.sleep(0.3)
+        finished.set()
+        return {}
+
+    monkeypatch.setattr(
+        statsimpact_routes,
+        "DASHBOARD_COMPUTES",
+        {"inline": lambda flt: {}, "fail": _fail, "slow": _slow},
+    )
+    with app.test_request_context():
+        with pytest.raises(RuntimeError):
+            statsimpact_routes._run_dashboard_computes({"inline", "fail", "slow"}, None)
+        # Le calcul lent est terminé avant que l'erreur ne quitte la requête
+        assert finished.is_set()
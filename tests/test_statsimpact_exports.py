@@ -0,0 +1,79 @@
+import csv
+import gzip
+from datetime import date
+from io import StringIO
+
+from app.extensions import db
+from app.models import AtelierActivite, Participant, PresenceActivite, Quartier, Role, SessionActivite, User
+from app.statsimpact.routes import CSV_FIELD_MAP
+
+from .conftest import login
+
+
+def test_csv_export_all_fields(app, client):
+    with app.app_context():
+        quartier = Quartier(nom="Rouher", ville="Creil")
+        db.session.add(quartier)
+        db.session.flush()
+        participant = Participant(
+            nom="Dupont", prenom="Alex", ville="Creil", quartier_id=quartier.id, date_naissance=date(1990, 5, 4)
+        )
+        atelier = AtelierActivite(secteur="Numérique", nom="Atelier", type_atelier="COLLECTIF")
+        db.session.add_all([participant, atelier])
+        db.session.flush()
+        session = SessionActivite(
+            atelier_id=atelier.id,
+            secteur="Numérique",
+            session_type="COLLECTIF",
+            date_session=date(2026, 3, 2),
+            heure_debut="14:00",
+        )
+        db.session.add(session)
+        db.session.flush()
+        db.session.add(PresenceActivite(session_id=session.id, participant_id=participant.id, motif="m"))
+        user = User(email="dir@test", nom="Dir", role="directrice")
+        user.set_password("pw")
+        user.roles.append(Role.query.filter_by(code="directrice").first())
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+    login(client, user_id)
+
+    query = "&".join(f"fields={f}" for f in CSV_FIELD_MAP)
+    resp = client.get(f"/stats-impact/magatomatique.csv?date_from=2026-01-01&date_to=2026-12-31&{query}")
+
+    assert resp.status_code == 200
+    rows = list(csv.DictReader(StringIO(resp.get_data(as_text=True)), delimiter=";"))
+    assert len(rows) == 1
+    row = rows[0]
+    assert list(row) == [field["label"] for field in CSV_FIELD_MAP.values()]
+    assert row["Nom"] == "Dupont"
+    assert row["Quartier"] == "Rouher"
+    assert row["Date naissance"] == "1990-05-04"
+    assert row["Date session"] == "2026-03-02"
+    assert row["Heure début"] == "14:00"
+    assert row["Secteur atelier"] == "Numérique"
+    assert row["Motif"] == "m"
+    assert row["Durée (minutes)"] == ""
+
+
+def test_only_csv_export_is_gzipped(app, client):
+    with app.app_context():
+        user = User(email="dir@test", nom="Dir", role="directrice")
+        user.set_password("pw")
+        user.roles.append(Role.query.filter_by(code="directrice").first())
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+    login(client, user_id)
+    headers = {"Accept-Encoding": "gzip"}
+
+    # Pages HTML : jeton CSRF + paramètres repris de l'URL, jamais compressées (BREACH)
+    page = client.get("/stats-impact/dashboard?participant_q=abc", headers=headers)
+    assert page.status_code == 200
+    assert "Content-Encoding" not in page.headers
+
+    export = client.get("/stats-impact/magatomatique.csv?fields=participant_nom", headers=headers)
+    assert export.status_code == 200
+    assert export.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(export.get_data()).decode("utf-8").startswith("Nom")
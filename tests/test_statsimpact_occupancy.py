@@ -0,0 +1,84 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import delete, update
+
+from app.extensions import db
+from app.models import AtelierActivite, Participant, PresenceActivite, SessionActivite
+from app.statsimpact import occupancy
+from app.statsimpact.engine import normalize_filters
+
+
+@pytest.fixture
+def seeded(app):
+    with app.app_context():
+        atelier = AtelierActivite(secteur="Numérique", nom="Atelier", type_atelier="COLLECTIF", capacite_defaut=4)
+        participant = Participant(nom="Dupont", prenom="Alex")
+        db.session.add_all([atelier, participant])
+        db.session.flush()
+        session = SessionActivite(
+            atelier_id=atelier.id, secteur="Numérique", session_type="COLLECTIF", date_session=date(2026, 3, 2)
+        )
+        db.session.add(session)
+        db.session.flush()
+        db.session.add(PresenceActivite(session_id=session.id, participant_id=participant.id))
+        db.session.commit()
+        occupancy._view_state["stale"] = False
+        yield {"participant_id": participant.id, "session_id": session.id}
+        occupancy._view_state["stale"] = True
+
+
+@pytest.mark.parametrize(
+    "bulk_write",
+    [
+        lambda ids: db.session.query(PresenceActivite)
+        .filter(PresenceActivite.participant_id == ids["participant_id"])
+        .delete(synchronize_session=False),
+        lambda ids: db.session.execute(
+            PresenceActivite.__table__.delete().where(PresenceActivite.participant_id == ids["participant_id"])
+        ),
+        lambda ids: db.session.execute(
+            update(SessionActivite).where(SessionActivite.id == ids["session_id"]).values(capacite=2)
+        ),
+    ],
+)
+def test_bulk_writes_mark_occupancy_view_stale(app, seeded, bulk_write):
+    with app.app_context():
+        bulk_write(seeded)
+        assert occupancy._view_state["stale"] is False  # seulement après le commit
+        db.session.commit()
+        assert occupancy._view_state["stale"] is True
+
+
+def test_bulk_write_on_other_table_keeps_view_fresh(app, seeded):
+    with app.app_context():
+        db.session.execute(delete(Participant).where(Participant.id == -1))
+        db.session.commit()
+        assert occupancy._view_state["stale"] is False
+
+
+def test_view_read_failure_falls_back_to_tables(app, seeded, monkeypatch):
+    # SQLite : la vue n'existe pas, la lecture échoue dès l'appel
+    monkeypatch.setattr(occupancy, "_occupancy_view_available", lambda: True)
+    with app.app_context():
+        flt = normalize_filters({"date_from": "2026-01-01", "date_to": "2026-12-31"})
+        stats = occupancy.compute_occupancy_stats(flt)
+    assert stats["collective_sessions"] == 1
+    assert stats["collective_presences"] == 1
+
+
+def test_refresh_failure_keeps_view_stale(app, seeded):
+    with app.app_context():
+        occupancy.mark_occupancy_view_stale()
+        with pytest.raises(Exception):
+            occupancy.refresh_occupancy_view()
+        assert occupancy._view_state["stale"] is True
+
+
+def test_view_lookup_error_is_not_cached(app, monkeypatch):
+    monkeypatch.setitem(occupancy._view_state, "available", None)
+    with app.app_context():
+        # to_regclass n'existe pas sous SQLite : erreur comme une coupure passagère
+        monkeypatch.setattr(db.engine.dialect, "name", "postgresql")
+        assert occupancy._occupancy_view_available() is False
+        assert occupancy._view_state["available"] is None
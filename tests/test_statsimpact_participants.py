@@ -0,0 +1,45 @@
+from datetime import date
+
+from flask_login import login_user
+
+from app.extensions import db
+from app.models import AtelierActivite, Participant, PresenceActivite, Role, SessionActivite, User
+from app.statsimpact.engine import compute_participants_stats, normalize_filters
+
+
+def test_participant_ateliers_keep_presence_order(app):
+    with app.app_context():
+        participant = Participant(nom="Dupont", prenom="Alex")
+        first = AtelierActivite(secteur="Numérique", nom="Premier", type_atelier="COLLECTIF")
+        second = AtelierActivite(secteur="Numérique", nom="Second", type_atelier="COLLECTIF")
+        db.session.add_all([participant, first, second])
+        db.session.flush()
+        # L'atelier suivi en premier n'est pas le plus récent : il doit pourtant rester en tête.
+        sessions = [
+            SessionActivite(atelier_id=first.id, secteur="Numérique", session_type="COLLECTIF", date_session=date(2026, 3, 1)),
+            SessionActivite(atelier_id=second.id, secteur="Numérique", session_type="COLLECTIF", date_session=date(2026, 4, 1)),
+            SessionActivite(atelier_id=first.id, secteur="Numérique", session_type="COLLECTIF", date_session=date(2026, 4, 1)),
+        ]
+        db.session.add_all(sessions)
+        db.session.flush()
+        db.session.add_all(PresenceActivite(session_id=s.id, participant_id=participant.id) for s in sessions)
+        user = User(email="dir@test", nom="Dir", role="directrice")
+        user.set_password("pw")
+        user.roles.append(Role.query.filter_by(code="directrice").first())
+        db.session.add(user)
+        db.session.commit()
+
+        with app.test_request_context():
+            login_user(user)
+            flt = normalize_filters({"date_from": "2026-01-01", "date_to": "2026-12-31"})
+            stats = compute_participants_stats(flt)
+
+        assert stats["total"] == 1
+        row = stats["participants"][0]
+        assert list(row["ateliers"]) == [first.id, second.id]
+        assert row["ateliers"][first.id]["dates"] == [date(2026, 4, 1), date(2026, 3, 1)]
+        assert [(s["date"], s["atelier_id"]) for s in row["sessions"]] == [
+            (date(2026, 4, 1), second.id),
+            (date(2026, 4, 1), first.id),
+            (date(2026, 3, 1), first.id),
+        ]
@@ -0,0 +1,74 @@
+from datetime import date
+
+from flask_login import login_user
+from sqlalchemy import event
+
+from app.extensions import db
+from app.models import AtelierActivite, Participant, PresenceActivite, Quartier, Role, SessionActivite, User
+from app.statsimpact.engine import compute_magatomatique, compute_participants_stats, normalize_filters
+
+
+def _add_participants(session_id: int, count: int, start: int) -> None:
+    """Un participant présent à la session par nouveau quartier."""
+    for i in range(start, start + count):
+        quartier = Quartier(nom=f"Quartier {i}", ville="Creil")
+        db.session.add(quartier)
+        db.session.flush()
+        participant = Participant(nom=f"Nom{i}", prenom="P", ville="Creil", quartier_id=quartier.id)
+        db.session.add(participant)
+        db.session.flush()
+        db.session.add(PresenceActivite(session_id=session_id, participant_id=participant.id))
+    db.session.commit()
+
+
+def _count_statements(app, user_id: int, compute) -> tuple[int, object]:
+    statements = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    # Session neuve : aucun quartier déjà en mémoire ne masque un chargement paresseux
+    db.session.remove()
+    with app.test_request_context():
+        login_user(db.session.get(User, user_id))
+        flt = normalize_filters({"date_from": "2026-01-01", "date_to": "2026-12-31"})
+        event.listen(db.engine, "after_cursor_execute", _record)
+        try:
+            result = compute(flt)
+        finally:
+            event.remove(db.engine, "after_cursor_execute", _record)
+    return len(statements), result
+
+
+def test_participant_listings_do_not_query_per_quartier(app):
+    with app.app_context():
+        atelier = AtelierActivite(secteur="Numérique", nom="Atelier", type_atelier="COLLECTIF")
+        db.session.add(atelier)
+        db.session.flush()
+        session = SessionActivite(
+            atelier_id=atelier.id, secteur="Numérique", session_type="COLLECTIF", date_session=date(2026, 3, 2)
+        )
+        user = User(email="dir@test", nom="Dir", role="directrice")
+        user.set_password("pw")
+        user.roles.append(Role.query.filter_by(code="directrice").first())
+        db.session.add_all([session, user])
+        db.session.commit()
+        session_id, user_id = session.id, user.id
+
+        computes = {
+            "participants": compute_participants_stats,
+            "magato": lambda flt: compute_magatomatique(flt, view="participants"),
+        }
+
+        _add_participants(session_id, 2, start=0)
+        small = {name: _count_statements(app, user_id, fn)[0] for name, fn in computes.items()}
+
+        _add_participants(session_id, 6, start=2)
+        large = {}
+        for name, fn in computes.items():
+            count, large[name] = _count_statements(app, user_id, fn)
+            # Même nombre de requêtes avec 8 quartiers qu'avec 2 : pas de requête par quartier
+            assert count == small[name], name
+
+        quartiers = sorted(p["quartier"] for p in large["participants"]["participants"])
+        assert quartiers == [f"Quartier {i}" for i in range(8)]